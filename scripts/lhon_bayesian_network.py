@@ -11,6 +11,11 @@ import seaborn as sns
 from scipy import stats
 import networkx as nx
 from itertools import product
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from lhon_bn_inference import VariableElimination, JunctionTree, normalize_evidence, evidence_indicator
+from lhon_subgroup_aggregation import SubgroupAggregator
+from lhon_bn_learning import HillClimbSearch
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -43,6 +48,9 @@ class LHONBayesianNetwork:
         # Prior probabilities and conditional probability tables
         self.initialize_parameters()
         
+        # Dense tensor form of the tables used for sampling and inference
+        self.compile()
+        
     def initialize_parameters(self):
         """Initialize all conditional probability tables"""
         
@@ -301,155 +309,1084 @@ class LHONBayesianNetwork:
         
         return cpt
     
-    def sample_from_network(self, n_samples=10000):
-        """Sample from the Bayesian network"""
+    def topological_sort(self):
+        """
+        Stable topological order of network_structure
         
-        samples = []
+        Kahn's algorithm that always takes the earliest node, in
+        network_structure order, whose parents are all placed.
+        """
         
-        for _ in range(n_samples):
-            sample = {}
-            
-            # Sample in topological order
-            for node in ['Population', 'mtDNA_Mutation', 'Haplogroup', 'Sex', 'Age',
-                        'Smoking', 'Alcohol', 'Nuclear_Variants', 'Environmental_Stress',
-                        'Mitochondrial_Function', 'Oxidative_Stress', 'Liability',
-                        'LHON_Phenotype', 'Recovery']:
-                
-                sample[node] = self._sample_node(node, sample)
+        order = []
+        remaining = list(self.network_structure)
+        placed = set()
+        
+        while remaining:
+            for node in remaining:
+                if all(parent in placed for parent in self.network_structure[node]):
+                    break
+            else:
+                raise ValueError(f"Network structure contains a cycle among {remaining}")
             
-            samples.append(sample)
+            order.append(node)
+            placed.add(node)
+            remaining.remove(node)
         
-        return pd.DataFrame(samples)
+        return order
     
-    def _sample_node(self, node, current_sample):
-        """Sample a single node given its parents"""
+    def _lookup_probs(self, node, parent_values):
+        """
+        Unnormalized state probabilities of a node given a tuple of parent values
+        
+        Nodes with a prior ignore their parents. Parent combinations missing
+        from a conditional table fall back to the node defaults (uniform for
+        nodes without one).
+        """
         
         if node in self.priors:
-            # Root node - sample from prior
-            probs = self.priors[node]
+            return self.priors[node]
+        
+        if node not in self.conditional_probs:
+            raise ValueError(f"No probabilities defined for node {node}")
+        
+        if parent_values in self.conditional_probs[node]:
+            return self.conditional_probs[node][parent_values]
+        
+        # Default probabilities if combination not found
+        if node == 'Smoking':
+            return {'None': 0.4, 'Light': 0.35, 'Heavy': 0.25}
+        elif node == 'Alcohol':
+            return {'None': 0.075, 'Light': 0.725, 'Heavy': 0.2}
         else:
-            # Get parent values
-            parents = self.network_structure[node]
-            parent_values = tuple(current_sample[p] for p in parents)
-            
-            # Get conditional probabilities
-            if node in self.conditional_probs:
-                if parent_values in self.conditional_probs[node]:
-                    probs = self.conditional_probs[node][parent_values]
-                else:
-                    # Default probabilities if combination not found
-                    if node == 'Smoking':
-                        probs = {'None': 0.4, 'Light': 0.35, 'Heavy': 0.25}
-                    elif node == 'Alcohol':
-                        probs = {'None': 0.075, 'Light': 0.725, 'Heavy': 0.2}
-                    else:
-                        # Uniform distribution as fallback
-                        states = list(next(iter(self.conditional_probs[node].values())).keys())
-                        prob_val = 1.0 / len(states)
-                        probs = {state: prob_val for state in states}
+            # Uniform distribution as fallback
+            states = list(next(iter(self.conditional_probs[node].values())).keys())
+            prob_val = 1.0 / len(states)
+            return {state: prob_val for state in states}
+    
+    def compile(self):
+        """
+        Build dense conditional probability tensors from priors and conditional_probs
+        
+        Sets topological_order, node_states (ordered state names),
+        state_codes ({node: {state: integer code}}), parents and cpts. Each
+        cpts[node] has one axis per parent, in network_structure order, plus
+        a final child axis, and sums to 1 over the child axis. Call again
+        after editing the probability dicts.
+        """
+        
+        self.topological_order = self.topological_sort()
+        self.parents = {node: list(self.network_structure[node]) for node in self.topological_order}
+        
+        # States in first-seen order across the prior or every table row
+        self.node_states = {}
+        for node in self.topological_order:
+            if node in self.priors:
+                tables = [self.priors[node]]
             else:
-                raise ValueError(f"No probabilities defined for node {node}")
+                tables = list(self.conditional_probs.get(node, {}).values())
+            
+            states = []
+            for table in tables:
+                states.extend(state for state in table if state not in states)
+            self.node_states[node] = states
+        
+        self.state_codes = {node: {state: code for code, state in enumerate(states)}
+                            for node, states in self.node_states.items()}
+        
+        self.cpts = {}
+        for node in self.topological_order:
+            parent_states = [self.node_states[p] for p in self.parents[node]]
+            states = self.node_states[node]
+            cpt = np.zeros([len(ps) for ps in parent_states] + [len(states)])
+            
+            for index in product(*[range(len(ps)) for ps in parent_states]):
+                parent_values = tuple(ps[i] for ps, i in zip(parent_states, index))
+                probs = self._lookup_probs(node, parent_values)
+                
+                row = np.zeros(len(states))
+                for state, prob in probs.items():
+                    if state not in self.state_codes[node]:
+                        raise ValueError(f"State {state} of {node} is missing from its state list")
+                    row[self.state_codes[node][state]] = prob
+                
+                # Normalize, falling back to uniform for all-zero rows
+                total = row.sum()
+                cpt[index] = row / total if total > 0 else 1.0 / len(states)
+            
+            self.cpts[node] = cpt
+        
+        # Inference engines are rebuilt lazily from the new tables
+        self._variable_elimination = None
+        self._junction_tree = None
+        
+        return self.cpts
+    
+    def query(self, target, evidence=None):
+        """
+        Exact posterior of target node(s) given evidence, by variable elimination
+        
+        evidence maps nodes to a state or a set of states, e.g.
+        {'mtDNA_Mutation': '11778G>A', 'Sex': 'Male'}.
+        """
+        
+        if self._variable_elimination is None:
+            self._variable_elimination = VariableElimination(self)
+        
+        return self._variable_elimination.query(target, evidence)
+    
+    def query_batch(self, target, evidence_table, evidence_nodes=None):
+        """
+        Posteriors of target for every row of an evidence table
+        
+        evidence_table is a DataFrame of node -> state columns (or an int code
+        array with evidence_nodes naming its columns). Returns a DataFrame of
+        posteriors with one column per target state and the table's index.
+        """
+        
+        if self._variable_elimination is None:
+            self._variable_elimination = VariableElimination(self)
+        
+        posteriors = self._variable_elimination.query_batch(target, evidence_table, evidence_nodes)
+        index = evidence_table.index if isinstance(evidence_table, pd.DataFrame) else None
+        
+        return pd.DataFrame(posteriors, index=index,
+                            columns=pd.Index(self.node_states[target], name=target))
+    
+    def mpe(self, evidence=None):
+        """
+        Most probable explanation: the likeliest joint state of every non-evidence node
         
-        # Sample from categorical distribution
-        states = list(probs.keys())
-        probabilities = list(probs.values())
+        Uses max-product variable elimination with argmax traceback. Returns
+        ({node: state}, posterior probability of that configuration).
+        """
         
-        # Normalize probabilities to ensure they sum to 1
-        prob_sum = sum(probabilities)
-        if prob_sum > 0:
-            probabilities = [p / prob_sum for p in probabilities]
+        return self.map(None, evidence)
+    
+    def map(self, query_vars, evidence=None):
+        """
+        Most probable joint state of query_vars, summing over the other nodes
+        
+        e.g. map(['Mitochondrial_Function', 'Oxidative_Stress', 'Liability'],
+        {'mtDNA_Mutation': '11778G>A', 'Sex': 'Male', 'Smoking': 'Heavy',
+        'LHON_Phenotype': 'Affected'}). Returns ({node: state}, posterior
+        probability of that configuration).
+        """
+        
+        if self._variable_elimination is None:
+            self._variable_elimination = VariableElimination(self)
+        
+        return self._variable_elimination.map_query(query_vars, evidence)
+    
+    def map_batch(self, query_vars, evidence_table, evidence_nodes=None):
+        """
+        MAP (or, with query_vars=None, MPE) configurations for every row of an evidence table
+        
+        evidence_table is as for query_batch; the elimination is shared by
+        all rows, so thousands of patients cost one pass plus a gather per
+        row. Returns a DataFrame with one state column per query node and
+        the configuration's posterior 'probability', on the table's index.
+        """
+        
+        if self._variable_elimination is None:
+            self._variable_elimination = VariableElimination(self)
+        
+        codes, probability = self._variable_elimination.map_batch(query_vars, evidence_table, evidence_nodes)
+        index = evidence_table.index if isinstance(evidence_table, pd.DataFrame) else None
+        
+        result = pd.DataFrame({node: pd.Categorical.from_codes(c, self.node_states[node])
+                               for node, c in codes.items()}, index=index)
+        result['probability'] = probability
+        
+        return result
+    
+    def junction_tree(self):
+        """Calibrated-on-demand junction tree of the compiled network (built once)"""
+        
+        if self._junction_tree is None:
+            self._junction_tree = JunctionTree(self)
+        
+        return self._junction_tree
+    
+    def collapse_haplogroups(self, haplogroups, tree):
+        """
+        Map detailed haplogroup labels to the network's Haplogroup states
+        
+        Each label is replaced by its nearest ancestor in `tree`
+        (a HaplogroupTree) among the network states, or 'Other'.
+        """
+        
+        states = [state for state in self.priors['Haplogroup'] if state != 'Other']
+        collapsed = tree.collapse_to(states, other='Other')
+        codes = tree.encode(haplogroups)
+        
+        return np.where(codes >= 0, collapsed[codes], 'Other')
+    
+    def sample_from_network(self, n_samples=10000, random_state=None, evidence=None,
+                            workers=None, shard_size=None, count_tables=None):
+        """
+        Sample from the Bayesian network
+        
+        Every node is drawn for all samples at once (see sample_codes) and
+        stored as a Categorical over the node's states, i.e. int8 codes plus
+        one shared vocabulary; labels only appear on export.
+        random_state may be None (global NumPy RNG), a seed or a Generator.
+        With evidence, samples are drawn by likelihood weighting (see
+        likelihood_weighted_codes) and a 'Weight' column is added.
+        
+        Passing workers, shard_size or count_tables switches to sharded,
+        streamed sampling (see sample_count_tables): no rows are returned,
+        only the summed count tables.
+        """
+        
+        if workers is not None or shard_size is not None or count_tables is not None:
+            return self.sample_count_tables(n_samples, count_tables, random_state, evidence,
+                                            workers or 1, shard_size or 1000000)
+        
+        if evidence is None:
+            codes = self.sample_codes(n_samples, random_state)
         else:
-            probabilities = [1.0 / len(states)] * len(states)
+            codes, weights = self.likelihood_weighted_codes(n_samples, evidence, random_state)
         
-        return np.random.choice(states, p=probabilities)
+        samples = pd.DataFrame({
+            node: pd.Categorical.from_codes(codes[node], categories=self.node_states[node])
+            for node in self.topological_order
+        })
+        if evidence is not None:
+            samples['Weight'] = weights
+        
+        return samples
     
-    def calculate_penetrance_by_subgroup(self, samples_df):
-        """Calculate penetrance for different subgroups"""
+    def family_tables(self):
+        """Every node's family (parents, node): the sufficient statistics of the CPTs"""
         
-        results = {}
+        return [tuple(self.parents[node]) + (node,) for node in self.topological_order]
+    
+    def count_codes(self, codes, count_tables, weights=None):
+        """
+        Contingency tables of sampled codes
+        
+        Returns {nodes: array with one axis per node}, holding sample counts
+        (or weight sums when weights are given).
+        """
+        
+        return _count_codes(codes, count_tables, self.node_states, weights)
+    
+    def _seed_root(self, random_state):
+        """Root SeedSequence for sharded sampling, determined by random_state alone"""
+        
+        if isinstance(random_state, np.random.SeedSequence):
+            # Copy, so spawning shards does not advance the caller's sequence
+            return np.random.SeedSequence(random_state.entropy, spawn_key=random_state.spawn_key)
+        if isinstance(random_state, np.random.Generator):
+            return np.random.SeedSequence(int(random_state.integers(2**63)))
+        return np.random.SeedSequence(random_state)
+    
+    def sample_count_tables(self, n_samples, count_tables=None, random_state=None, evidence=None,
+                            workers=1, shard_size=1000000, parquet_path=None, max_in_flight=None):
+        """
+        Sharded, streamed sampling reduced to count tables
+        
+        Samples are drawn in shards of shard_size, each with its own
+        SeedSequence spawned from random_state when the shard is submitted.
+        Shards run in a pool of `workers` processes with at most
+        max_in_flight (default 2 * workers) outstanding at a time; each is
+        reduced to count tables in its worker and added in place to running
+        totals in shard order. Memory therefore stays constant in n_samples,
+        and the totals do not depend on the number of workers.
         
-        # Overall penetrance
-        total_carriers = samples_df[samples_df['mtDNA_Mutation'] != 'None']
-        if len(total_carriers) > 0:
-            overall_penetrance = (total_carriers['LHON_Phenotype'] == 'Affected').mean()
-            results['Overall'] = overall_penetrance
+        count_tables defaults to every node's family; with evidence the
+        tables hold likelihood weights. Each task carries only the compiled
+        CPT arrays, parents, topological order and state names. With parquet_path, every shard also
+        writes its rows as one part file of a Parquet dataset in that
+        directory (requires pyarrow).
+        
+        Returns {tuple of nodes: Series of counts over the state combinations}.
+        """
+        
+        if count_tables is None:
+            count_tables = self.family_tables()
+        count_tables = [tuple(nodes) for nodes in count_tables]
+        
+        if parquet_path is not None:
+            os.makedirs(parquet_path, exist_ok=True)
+        
+        root = self._seed_root(random_state)
+        n_shards = -(-n_samples // shard_size)
+        
+        # Workers only need the compiled tables, not the network and its inference caches
+        model = {
+            'topological_order': self.topological_order,
+            'parents': {node: self.parents[node] for node in self.topological_order},
+            'cpts': self.cpts,
+            'node_states': self.node_states
+        }
+        indicators = None if evidence is None else self._evidence_indicators(evidence)
+        
+        def task(k):
+            # Spawning one child at a time yields the same streams as spawn(n_shards)
+            return (model, min(shard_size, n_samples - k * shard_size), root.spawn(1)[0],
+                    count_tables, indicators, parquet_path, k)
+        
+        totals = {nodes: np.zeros(tuple(len(self.node_states[n]) for n in nodes),
+                                  dtype=np.int64 if evidence is None else np.float64)
+                  for nodes in count_tables}
+        
+        def accumulate(tables):
+            for nodes in count_tables:
+                totals[nodes] += tables[nodes]
+        
+        if workers > 1:
+            if max_in_flight is None:
+                max_in_flight = 2 * workers
+            
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = {}
+                completed = {}
+                next_submit = next_add = 0
+                
+                while next_add < n_shards:
+                    while next_submit < n_shards and len(pending) + len(completed) < max_in_flight:
+                        pending[executor.submit(_sample_shard, *task(next_submit))] = next_submit
+                        next_submit += 1
+                    
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        completed[pending.pop(future)] = future.result()
+                    
+                    # Add finished shards in order so floating-point sums are reproducible
+                    while next_add in completed:
+                        accumulate(completed.pop(next_add))
+                        next_add += 1
+        else:
+            for k in range(n_shards):
+                accumulate(_sample_shard(*task(k)))
+        
+        return {nodes: self.count_table_series(nodes, counts) for nodes, counts in totals.items()}
+    
+    def count_table_series(self, nodes, counts):
+        """Count array as a Series over the nodes' state combinations"""
+        
+        if len(nodes) == 1:
+            index = pd.Index(self.node_states[nodes[0]], name=nodes[0])
+        else:
+            index = pd.MultiIndex.from_product([self.node_states[node] for node in nodes], names=list(nodes))
+        
+        return pd.Series(np.asarray(counts).ravel(), index=index, name='count')
+    
+    def fit(self, data, prior_strength=1.0, prior='current', max_iter=100, tol=1e-6, batch_size=4096,
+            prior_floor=1e-3):
+        """
+        Estimate every CPT from individual-level records
+        
+        data has one column per observed node (state labels, categoricals or
+        codes); missing values (NaN) and absent columns are latent. Counts are
+        taken with np.bincount over mixed-radix family codes, and each CPT
+        row is the Dirichlet posterior mean with pseudo-counts
+        prior_strength * prior row, where prior is 'current' (the tables
+        before fitting, with entries floored at prior_floor and rows
+        renormalised, so states they rule out keep a positive pseudo-count)
+        or 'uniform'; EM also starts from the floored tables. If any value
+        is missing, EM is run:
+        distinct incomplete configurations are grouped once by missingness
+        pattern before the first iteration; families with a missing member
+        get their expected counts from batched junction-tree passes over the
+        pattern's prebuilt evidence indicators, the rest are counted directly.
+        
+        The fitted tables are written back to priors/conditional_probs (keyed
+        by all parents) and the network is recompiled. Returns a dict with
+        the observed-data log-likelihood after each update (the last entry
+        is that of the fitted tables), the number of iterations and whether
+        EM converged.
+        """
+        
+        order = self.topological_order
+        n_rows = len(data)
+        
+        # Integer codes, -1 for missing; single-state nodes are always known
+        codes = np.full((n_rows, len(order)), -1, dtype=np.int8)
+        for k, node in enumerate(order):
+            if len(self.node_states[node]) == 1:
+                codes[:, k] = 0
+            elif node in data:
+                codes[:, k] = self._codes(data, node)
+        
+        shapes = {node: self.cpts[node].shape for node in order}
+        family_columns = {node: [order.index(p) for p in self.parents[node]] + [order.index(node)]
+                          for node in order}
+        
+        complete = (codes >= 0).all(axis=1)
+        
+        # Complete rows: plain family counts
+        complete_codes = codes[complete].astype(np.int64)
+        complete_counts = {}
+        for node in order:
+            key = np.ravel_multi_index(complete_codes[:, family_columns[node]].T, shapes[node])
+            complete_counts[node] = np.bincount(key, minlength=int(np.prod(shapes[node]))).reshape(shapes[node])
+        
+        # Incomplete rows: distinct configurations grouped once by missingness
+        # pattern, with the evidence indicators of every batch built here and
+        # reused by each EM iteration. Families with no missing member are
+        # counted directly; only the others need the junction tree.
+        fixed_counts = {node: complete_counts[node].astype(np.float64) for node in order}
+        configs, multiplicity = np.unique(codes[~complete], axis=0, return_counts=True)
+        pattern = (configs < 0).astype(np.int64) @ (np.int64(1) << np.arange(len(order), dtype=np.int64))
+        by_pattern = np.argsort(pattern, kind='stable')
+        configs, multiplicity = configs[by_pattern].astype(np.int64), multiplicity[by_pattern]
+        _, starts = np.unique(pattern[by_pattern], return_index=True)
+        
+        groups = []
+        for first, end in zip(starts, list(starts[1:]) + [len(configs)]):
+            observed = [k for k in range(len(order))
+                        if configs[first, k] >= 0 and len(self.node_states[order[k]]) > 1]
+            latent = [node for node in order if (configs[first, family_columns[node]] < 0).any()]
+            for node in order:
+                if node not in latent:
+                    key = np.ravel_multi_index(configs[first:end, family_columns[node]].T, shapes[node])
+                    fixed_counts[node] += np.bincount(key, weights=multiplicity[first:end],
+                                                      minlength=fixed_counts[node].size).reshape(shapes[node])
+            for start in range(first, end, batch_size):
+                chunk = configs[start:min(start + batch_size, end)]
+                indicators = {order[k]: np.eye(len(self.node_states[order[k]]))[chunk[:, k]] for k in observed}
+                groups.append((indicators, multiplicity[start:min(start + batch_size, end)], latent))
+        
+        # Current tables with zero entries floored, so no observed state is impossible
+        cpts = {}
+        for node in order:
+            floored = np.maximum(self.cpts[node], prior_floor)
+            cpts[node] = floored / floored.sum(axis=-1, keepdims=True)
+        
+        if prior == 'uniform':
+            pseudo = {node: np.full(shapes[node], prior_strength / shapes[node][-1]) for node in order}
+        else:
+            pseudo = {node: prior_strength * cpts[node] for node in order}
+        
+        jt = JunctionTree(self) if groups else None
+        
+        def e_step(cpts):
+            # Expected family counts and observed-data log-likelihood under cpts
+            expected = {node: fixed_counts[node].copy() for node in order}
+            log_likelihood = 0.0
+            for node in order:
+                observed = complete_counts[node] > 0
+                log_likelihood += np.sum(complete_counts[node][observed] * np.log(cpts[node][observed]))
+            
+            if groups:
+                jt.set_parameters(cpts)
+                for indicators, counts, latent in groups:
+                    marginals, evidence_probability = jt.batch_family_marginals(indicators, latent)
+                    
+                    if not indicators:
+                        marginals = {node: m[None] for node, m in marginals.items()}
+                        evidence_probability = np.atleast_1d(evidence_probability)
+                    
+                    row_weights = counts / evidence_probability
+                    for node in latent:
+                        expected[node] += np.tensordot(row_weights, marginals[node], axes=1)
+                    log_likelihood += np.sum(counts * np.log(evidence_probability))
+            
+            return expected, float(log_likelihood)
+        
+        expected, previous = e_step(cpts)
+        history = []
+        converged = not groups
+        
+        for iteration in range(max_iter if groups else 1):
+            # Dirichlet posterior mean; rows without counts or prior stay uniform
+            for node in order:
+                totals = expected[node] + pseudo[node]
+                row_sums = totals.sum(axis=-1, keepdims=True)
+                cpts[node] = np.where(row_sums > 0, totals / np.where(row_sums > 0, row_sums, 1),
+                                      1.0 / shapes[node][-1])
+            
+            expected, log_likelihood = e_step(cpts)
+            history.append(log_likelihood)
+            
+            if groups and abs(log_likelihood - previous) <= tol * abs(previous):
+                converged = True
+                break
+            previous = log_likelihood
+        
+        # Write the fitted tables back in dict form and recompile
+        for node in order:
+            states = self.node_states[node]
+            parent_states = [self.node_states[p] for p in self.parents[node]]
+            table = cpts[node].reshape(-1, len(states))
+            
+            if node in self.priors and table.shape[0] == 1:
+                self.priors[node] = dict(zip(states, table[0]))
+            else:
+                self.priors.pop(node, None)
+                self.conditional_probs[node] = {
+                    parent_values: dict(zip(states, row))
+                    for parent_values, row in zip(product(*parent_states), table)
+                }
+        
+        self.compile()
+        
+        return {
+            'log_likelihood': history,
+            'n_iter': len(history),
+            'converged': converged
+        }
+    
+    def learn_structure(self, data, score='bic', start='current', apply=False, max_iter=1000,
+                        tabu_length=0, patience=10, **kwargs):
+        """
+        Score-based structure search over the network's nodes (see HillClimbSearch)
+        
+        start is 'current' (network_structure), 'empty' or a {node: [parents]}
+        dict; further keyword arguments (equivalent_sample_size,
+        max_indegree, forbidden_edges, workers) go to HillClimbSearch. With
+        apply=True the learned structure replaces network_structure and the
+        CPTs are refitted on data. Returns the search result dict.
+        """
+        
+        if isinstance(start, str):
+            start = {} if start == 'empty' else self.network_structure
+        
+        search = HillClimbSearch.from_network(self, data, score=score, **kwargs)
+        result = search.search(start, max_iter=max_iter, tabu_length=tabu_length, patience=patience)
+        
+        if apply:
+            self.network_structure = {node: list(result['structure'][node]) for node in self.network_structure}
+            self.compile()
+            self.fit(data, prior='uniform')
+        
+        return result
+    
+    def _get_rng(self, random_state):
+        """Generator for a seed or Generator; the global NumPy RNG for None"""
+        
+        if random_state is None:
+            return np.random
+        if isinstance(random_state, np.random.Generator):
+            return random_state
+        return np.random.default_rng(random_state)
+    
+    def sample_codes(self, n_samples, random_state=None):
+        """
+        Vectorized ancestral sampling on the compiled CPTs
+        
+        For each node in topological order, the parent code arrays select a
+        row of the node's cumulative table and one uniform per sample is
+        compared against it. Returns {node: integer state codes}.
+        """
+        
+        codes, _ = _ancestral_codes(self.topological_order, self.parents, self.cpts,
+                                    n_samples, self._get_rng(random_state))
+        return codes
+    
+    def likelihood_weighted_codes(self, n_samples, evidence, random_state=None):
+        """
+        Ancestral sampling with evidence nodes clamped (likelihood weighting)
+        
+        Evidence takes the same forms as query. A node clamped to a set of
+        states is drawn from its CPT row restricted to that set. Each sample's
+        weight is the product, over evidence nodes, of the CPT mass of the
+        allowed states given the sampled parents. Returns (codes, weights).
+        """
+        
+        return _ancestral_codes(self.topological_order, self.parents, self.cpts, n_samples,
+                                self._get_rng(random_state), self._evidence_indicators(evidence))
+    
+    def _evidence_indicators(self, evidence):
+        """Evidence as {node: 0/1 indicator over its states}"""
+        
+        return {node: evidence_indicator(self, node, codes)
+                for node, codes in normalize_evidence(self, evidence).items()}
+    
+    @staticmethod
+    def effective_sample_size(weights):
+        """Kish effective sample size of importance weights"""
         
-        # By mutation
+        weights = np.asarray(weights, dtype=np.float64)
+        total = np.sum(weights**2)
+        return float(weights.sum()**2 / total) if total > 0 else 0.0
+    
+    def likelihood_weighting(self, target, evidence, n_samples=10000, random_state=None):
+        """
+        Approximate posterior of a node by likelihood weighting
+        
+        Returns (posterior Series over the target's states, effective sample size).
+        """
+        
+        codes, weights = self.likelihood_weighted_codes(n_samples, evidence, random_state)
+        n_states = len(self.node_states[target])
+        totals = np.bincount(codes[target], weights=weights, minlength=n_states)
+        if totals.sum() <= 0:
+            raise ValueError(f"No sample is consistent with evidence {evidence}")
+        
+        posterior = pd.Series(totals / totals.sum(),
+                              index=pd.Index(self.node_states[target], name=target), name='probability')
+        
+        return posterior, self.effective_sample_size(weights)
+    
+    def encode_samples(self, samples_df):
+        """
+        Convert label columns (e.g. read back from CSV) to categoricals
+        
+        Each node column gets the network's state vocabulary, so filters and
+        counts can run on its integer codes.
+        """
+        
+        encoded = samples_df.copy()
+        for node in self.topological_order:
+            if node in encoded and not isinstance(encoded[node].dtype, pd.CategoricalDtype):
+                encoded[node] = pd.Categorical(encoded[node], categories=self.node_states[node])
+        
+        return encoded
+    
+    def _codes(self, samples_df, node):
+        """Integer state codes of a sample column (categorical or label-valued)"""
+        
+        column = samples_df[node]
+        if (isinstance(column.dtype, pd.CategoricalDtype) and
+                list(column.cat.categories) == self.node_states[node]):
+            return column.cat.codes.to_numpy()
+        
+        return column.map(self.state_codes[node]).fillna(-1).to_numpy(dtype=np.int64)
+    
+    def _is(self, samples_df, node, state):
+        """Boolean mask of samples in which node takes the given state"""
+        
+        return self._codes(samples_df, node) == self.state_codes[node][state]
+    
+    def subgroup_aggregator(self):
+        """
+        SubgroupAggregator with the penetrance and recovery subgroups
+        
+        Penetrance groupings (prefixed 'penetrance_') are P(Affected) among
+        carriers; recovery groupings (prefixed 'recovery_') are recovery
+        shares among affected individuals.
+        """
+        
+        carriers = ['11778G>A', '14484T>C', '3460G>A']
+        any_recovery = ['Partial', 'Complete']
+        affected = {'LHON_Phenotype': ['Affected']}
+        
+        aggregator = SubgroupAggregator(self.node_states)
+        
+        # Penetrance: overall, by mutation, by sex, by mutation and sex,
+        # heavy smokers and the high-risk combination
+        (aggregator
+         .add_grouping('penetrance_overall', [], 'LHON_Phenotype', ['Affected'],
+                       {'mtDNA_Mutation': carriers}, label='Overall')
+         .add_grouping('penetrance_mutation', ['mtDNA_Mutation'], 'LHON_Phenotype', ['Affected'],
+                       {'mtDNA_Mutation': carriers})
+         .add_grouping('penetrance_sex', ['Sex'], 'LHON_Phenotype', ['Affected'],
+                       {'mtDNA_Mutation': carriers})
+         .add_grouping('penetrance_mutation_sex', ['mtDNA_Mutation', 'Sex'], 'LHON_Phenotype', ['Affected'],
+                       {'mtDNA_Mutation': carriers})
+         .add_grouping('penetrance_heavy_smokers', [], 'LHON_Phenotype', ['Affected'],
+                       {'mtDNA_Mutation': carriers, 'Smoking': ['Heavy']}, label='Heavy_Smokers')
+         .add_grouping('penetrance_high_risk', [], 'LHON_Phenotype', ['Affected'],
+                       {'mtDNA_Mutation': ['11778G>A'], 'Sex': ['Male'], 'Smoking': ['Heavy']},
+                       label='High_Risk_11778_Male_Heavy_Smoker'))
+        
+        # Recovery among the affected: overall, by mutation and by age
+        (aggregator
+         .add_grouping('recovery_overall_any', [], 'Recovery', any_recovery, affected,
+                       label='Overall_Any_Recovery')
+         .add_grouping('recovery_overall_complete', [], 'Recovery', ['Complete'], affected,
+                       label='Overall_Complete_Recovery')
+         .add_grouping('recovery_mutation_any', ['mtDNA_Mutation'], 'Recovery', any_recovery,
+                       {**affected, 'mtDNA_Mutation': carriers}, label='{mtDNA_Mutation}_Any_Recovery')
+         .add_grouping('recovery_mutation_complete', ['mtDNA_Mutation'], 'Recovery', ['Complete'],
+                       {**affected, 'mtDNA_Mutation': carriers}, label='{mtDNA_Mutation}_Complete_Recovery')
+         .add_grouping('recovery_age', ['Age'], 'Recovery', any_recovery, affected,
+                       label='{Age}_Recovery'))
+        
+        return aggregator
+    
+    def subgroup_table(self, samples_df, method='wilson', ci=0.95):
+        """
+        Tidy penetrance and recovery table with confidence intervals
+        
+        All subgroups are counted in one pass per grouping (see
+        subgroup_aggregator); a 'Weight' column makes the table weighted,
+        with intervals on the effective sample size. method is 'wilson' or
+        'jeffreys'.
+        """
+        
+        weights = samples_df['Weight'].to_numpy() if 'Weight' in samples_df else None
+        
+        return self.subgroup_aggregator().aggregate(samples_df, weights, method, ci)
+    
+    def calculate_penetrance_by_subgroup(self, samples_df=None):
+        """
+        Calculate penetrance for different subgroups
+        
+        Without samples_df the penetrances are exact (see
+        exact_penetrance_by_subgroup). Likelihood-weighted samples (with a
+        'Weight' column) give weighted estimates; see subgroup_effective_sizes.
+        Intervals for the same subgroups come from subgroup_table.
+        """
+        
+        if samples_df is None:
+            return self.exact_penetrance_by_subgroup()
+        
+        table = self.subgroup_table(samples_df)
+        table = table[table['grouping'].str.startswith('penetrance_') & (table['n'] > 0)]
+        
+        return dict(zip(table['subgroup'], table['rate']))
+    
+    def subgroup_effective_sizes(self, samples_df):
+        """
+        Effective sample size behind each calculate_penetrance_by_subgroup entry
+        
+        Equal to the subgroup size for unweighted samples.
+        """
+        
+        table = self.subgroup_table(samples_df)
+        table = table[table['grouping'].str.startswith('penetrance_') & (table['n'] > 0)]
+        
+        return dict(zip(table['subgroup'], table['effective_n']))
+    
+    def calculate_recovery_rates(self, samples_df=None):
+        """
+        Calculate recovery rates by subgroup
+        
+        Without samples_df the rates are exact (see exact_recovery_rates).
+        """
+        
+        if samples_df is None:
+            return self.exact_recovery_rates()
+        
+        table = self.subgroup_table(samples_df)
+        table = table[table['grouping'].str.startswith('recovery_') & (table['n'] > 0)]
+        rates = dict(zip(table['subgroup'], table['rate']))
+        
+        # Report order: overall, then any/complete per mutation, then age
+        order = ['Overall_Any_Recovery', 'Overall_Complete_Recovery']
         for mutation in ['11778G>A', '14484T>C', '3460G>A']:
-            mut_carriers = samples_df[samples_df['mtDNA_Mutation'] == mutation]
-            if len(mut_carriers) > 0:
-                penetrance = (mut_carriers['LHON_Phenotype'] == 'Affected').mean()
-                results[f'{mutation}'] = penetrance
+            order.extend([f'{mutation}_Any_Recovery', f'{mutation}_Complete_Recovery'])
+        order.extend(f'{age}_Recovery' for age in ['Young', 'Peak', 'Middle', 'Late'])
         
-        # By sex
-        for sex in ['Male', 'Female']:
-            sex_carriers = total_carriers[total_carriers['Sex'] == sex]
-            if len(sex_carriers) > 0:
-                penetrance = (sex_carriers['LHON_Phenotype'] == 'Affected').mean()
-                results[f'{sex}'] = penetrance
+        return {subgroup: rates[subgroup] for subgroup in order if subgroup in rates}
+
+    def exact_penetrance_by_subgroup(self):
+        """
+        The calculate_penetrance_by_subgroup table computed exactly
+        
+        Uses five junction-tree calibrations: all carriers, each mutation and
+        the high-risk combination; sex and smoking breakdowns are read off
+        pairwise marginals.
+        """
+        
+        jt = self.junction_tree()
+        mutations = ['11778G>A', '14484T>C', '3460G>A']
+        results = {}
+        
+        # All carriers
+        jt.set_evidence({'mtDNA_Mutation': mutations})
+        by_sex = jt.pairwise('Sex', 'LHON_Phenotype')
+        results['Overall'] = by_sex['Affected'].sum()
+        carrier_by_sex = by_sex['Affected'] / by_sex.sum(axis=1)
+        
+        by_smoking = jt.pairwise('Smoking', 'LHON_Phenotype')
+        heavy_smokers = by_smoking.loc['Heavy', 'Affected'] / by_smoking.loc['Heavy'].sum()
         
         # By mutation and sex
-        for mutation in ['11778G>A', '14484T>C', '3460G>A']:
+        mutation_by_sex = {}
+        for mutation in mutations:
+            jt.set_evidence({'mtDNA_Mutation': mutation})
+            by_sex = jt.pairwise('Sex', 'LHON_Phenotype')
+            results[mutation] = by_sex['Affected'].sum()
+            mutation_by_sex[mutation] = by_sex['Affected'] / by_sex.sum(axis=1)
+        
+        for sex in ['Male', 'Female']:
+            results[sex] = carrier_by_sex[sex]
+        
+        for mutation in mutations:
             for sex in ['Male', 'Female']:
-                subgroup = samples_df[
-                    (samples_df['mtDNA_Mutation'] == mutation) & 
-                    (samples_df['Sex'] == sex)
-                ]
-                if len(subgroup) > 0:
-                    penetrance = (subgroup['LHON_Phenotype'] == 'Affected').mean()
-                    results[f'{mutation}_{sex}'] = penetrance
-        
-        # By environmental factors
-        heavy_smokers = total_carriers[total_carriers['Smoking'] == 'Heavy']
-        if len(heavy_smokers) > 0:
-            penetrance = (heavy_smokers['LHON_Phenotype'] == 'Affected').mean()
-            results['Heavy_Smokers'] = penetrance
+                results[f'{mutation}_{sex}'] = mutation_by_sex[mutation][sex]
+        
+        results['Heavy_Smokers'] = heavy_smokers
         
         # High-risk combination (male, heavy smoker, 11778G>A)
-        high_risk = samples_df[
-            (samples_df['mtDNA_Mutation'] == '11778G>A') & 
-            (samples_df['Sex'] == 'Male') &
-            (samples_df['Smoking'] == 'Heavy')
-        ]
-        if len(high_risk) > 0:
-            penetrance = (high_risk['LHON_Phenotype'] == 'Affected').mean()
-            results['High_Risk_11778_Male_Heavy_Smoker'] = penetrance
+        jt.set_evidence({'mtDNA_Mutation': '11778G>A', 'Sex': 'Male', 'Smoking': 'Heavy'})
+        results['High_Risk_11778_Male_Heavy_Smoker'] = jt.marginal('LHON_Phenotype')['Affected']
         
-        return results
-    
-    def calculate_recovery_rates(self, samples_df):
-        """Calculate recovery rates by subgroup"""
+        jt.set_evidence({})
         
-        affected = samples_df[samples_df['LHON_Phenotype'] == 'Affected']
+        return {subgroup: float(value) for subgroup, value in results.items()}
+    
+    def exact_recovery_rates(self):
+        """The calculate_recovery_rates table from a single junction-tree calibration"""
         
-        if len(affected) == 0:
-            return {}
+        jt = self.junction_tree()
+        jt.set_evidence({'LHON_Phenotype': 'Affected'})
         
-        results = {}
+        recovery = jt.marginal('Recovery')
+        by_mutation = jt.pairwise('mtDNA_Mutation', 'Recovery')
+        by_age = jt.pairwise('Age', 'Recovery')
         
-        # Overall recovery
-        recovery_rate = (affected['Recovery'] != 'No_Recovery').mean()
-        complete_recovery = (affected['Recovery'] == 'Complete').mean()
-        results['Overall_Any_Recovery'] = recovery_rate
-        results['Overall_Complete_Recovery'] = complete_recovery
+        results = {
+            'Overall_Any_Recovery': 1 - recovery['No_Recovery'],
+            'Overall_Complete_Recovery': recovery['Complete']
+        }
         
-        # By mutation
         for mutation in ['11778G>A', '14484T>C', '3460G>A']:
-            mut_affected = affected[affected['mtDNA_Mutation'] == mutation]
-            if len(mut_affected) > 0:
-                recovery_rate = (mut_affected['Recovery'] != 'No_Recovery').mean()
-                complete_recovery = (mut_affected['Recovery'] == 'Complete').mean()
-                results[f'{mutation}_Any_Recovery'] = recovery_rate
-                results[f'{mutation}_Complete_Recovery'] = complete_recovery
-        
-        # By age
+            row = by_mutation.loc[mutation] / by_mutation.loc[mutation].sum()
+            results[f'{mutation}_Any_Recovery'] = 1 - row['No_Recovery']
+            results[f'{mutation}_Complete_Recovery'] = row['Complete']
+        
         for age in ['Young', 'Peak', 'Middle', 'Late']:
-            age_affected = affected[affected['Age'] == age]
-            if len(age_affected) > 0:
-                recovery_rate = (age_affected['Recovery'] != 'No_Recovery').mean()
-                results[f'{age}_Recovery'] = recovery_rate
+            row = by_age.loc[age] / by_age.loc[age].sum()
+            results[f'{age}_Recovery'] = 1 - row['No_Recovery']
         
-        return results
+        jt.set_evidence({})
+        
+        return {subgroup: float(value) for subgroup, value in results.items()}
+    
+    def cpt_ensemble(self, n_draws=1000, concentration=100.0, random_state=None, include_priors=False):
+        """
+        Dirichlet perturbations of the CPTs, stacked on a leading draw axis
+        
+        Each row theta of cpts[node] is redrawn n_draws times from
+        Dirichlet(concentration * theta), so larger concentrations mean less
+        parameter uncertainty and zero entries stay zero. concentration may
+        be a {node: value} dict (nodes not listed are kept fixed). A scalar
+        concentration only applies to the conditional tables: the prior
+        (frequency) tables in self.priors stay fixed unless
+        include_priors=True, since rare states such as the mutation
+        frequencies get Dirichlet shapes far below 1 and degenerate draws.
+        Returns {node: array of shape (n_draws, *cpts[node].shape)}.
+        """
+        
+        rng = self._get_rng(random_state)
+        ensemble = {}
+        
+        for node in self.topological_order:
+            cpt = self.cpts[node]
+            if isinstance(concentration, dict):
+                strength = concentration.get(node)
+            else:
+                strength = concentration if include_priors or node not in self.priors else None
+            if strength is None:
+                ensemble[node] = np.broadcast_to(cpt, (n_draws,) + cpt.shape)
+                continue
+            
+            # Dirichlet rows as normalized gamma draws, in log space so that
+            # small shapes (rare states) do not underflow to exact zeros:
+            # Gamma(a) = Gamma(a + 1) * U**(1 / a)
+            alpha = np.broadcast_to(strength * cpt, (n_draws,) + cpt.shape)
+            positive = alpha > 0
+            safe_alpha = np.where(positive, alpha, 1.0)
+            log_draws = (np.log(rng.standard_gamma(safe_alpha + 1)) +
+                         np.log(rng.uniform(size=alpha.shape)) / safe_alpha)
+            log_draws = np.where(positive, log_draws, -np.inf)
+            
+            draws = np.exp(log_draws - log_draws.max(axis=-1, keepdims=True))
+            draws /= draws.sum(axis=-1, keepdims=True)
+            ensemble[node] = np.where(positive, np.maximum(draws, np.finfo(float).tiny), 0.0)
+        
+        return ensemble
+    
+    def ensemble_subgroup_table(self, n_draws=1000, concentration=100.0, ci=0.95,
+                                random_state=None, ensemble=None, include_priors=False):
+        """
+        Penetrance and recovery subgroups with credible intervals over CPT uncertainty
+        
+        Every subgroup_aggregator grouping is computed exactly by variable
+        elimination with all draws of cpt_ensemble (or the given ensemble)
+        carried as a leading batch axis, so each grouping costs one
+        vectorized elimination rather than one per draw. Returns the
+        grouping/subgroup columns with the point estimate 'rate' and the
+        ensemble 'mean', 'sd', 'ci_low' and 'ci_high' (equal-tailed
+        quantiles) for every subgroup with positive probability.
+        """
+        
+        if ensemble is None:
+            ensemble = self.cpt_ensemble(n_draws, concentration, random_state, include_priors)
+        
+        if self._variable_elimination is None:
+            self._variable_elimination = VariableElimination(self)
+        ve = self._variable_elimination
+        
+        aggregator = self.subgroup_aggregator()
+        tail = (1 - ci) / 2
+        frames = []
+        
+        for grouping in aggregator.groupings:
+            targets = grouping['by'] + [grouping['outcome']]
+            evidence = grouping['where']
+            
+            # (*by, outcome) for the point CPTs and (K, *by, outcome) for the ensemble
+            point = ve.joint(targets, evidence)
+            draws = ve.joint(targets, evidence, cpts=ensemble)
+            
+            point_n = point.sum(axis=-1).ravel()
+            point_rate = point[..., grouping['success']].sum(axis=-1).ravel() / np.where(point_n > 0, point_n, 1.0)
+            
+            # Cells impossible under the point CPTs (e.g. non-carriers) are dropped
+            keep = point_n > 0
+            draw_n = draws.sum(axis=-1).reshape(len(draws), -1)[:, keep]
+            draw_rate = draws[..., grouping['success']].sum(axis=-1).reshape(len(draws), -1)[:, keep] / draw_n
+            
+            frame = aggregator.cells(grouping)[keep]
+            frame['rate'] = point_rate[keep]
+            frame['mean'] = draw_rate.mean(axis=0)
+            frame['sd'] = draw_rate.std(axis=0)
+            frame['ci_low'] = np.quantile(draw_rate, tail, axis=0)
+            frame['ci_high'] = np.quantile(draw_rate, 1 - tail, axis=0)
+            frames.append(frame)
+        
+        return pd.concat(frames, ignore_index=True)
+
+    def parameter_sensitivity(self, target, state=None, evidence=None):
+        """
+        Ranked sensitivity of P(target = state | evidence) to every CPT entry
+        
+        Derivatives of P(evidence) and P(target, evidence) with respect to
+        all CPT entries come from one batched junction-tree pass (see
+        JunctionTree.batch_parameter_derivatives); the query derivative
+        follows from the quotient rule. 'derivative' moves one entry alone;
+        'covaried_derivative' rescales the rest of its row proportionally so
+        the row still sums to 1 (undefined, NaN, for entries equal to 1).
+        state=None covers every state of the target. Returns one row per
+        query and CPT entry, sorted by absolute co-varied derivative.
+        """
+        
+        evidence = normalize_evidence(self, evidence)
+        if target in evidence:
+            raise ValueError(f"Target {target} cannot also be evidence")
+        
+        states = self.node_states[target] if state is None else [state]
+        codes = [self.state_codes[target][s] for s in states]
+        n_batch = 1 + len(codes)
+        
+        # Row 0 is P(evidence); row 1 + k adds target = states[k]
+        indicators = {node: np.tile(evidence_indicator(self, node, allowed), (n_batch, 1))
+                      for node, allowed in evidence.items()}
+        target_indicator = np.ones((n_batch, len(self.node_states[target])))
+        target_indicator[1:] = np.eye(len(self.node_states[target]))[codes]
+        indicators[target] = target_indicator
+        
+        derivatives, probability = self.junction_tree().batch_parameter_derivatives(indicators)
+        if probability[0] <= 0:
+            raise ValueError(f"Evidence {evidence} has zero probability")
+        
+        frames = []
+        for node in self.topological_order:
+            if len(self.node_states[node]) < 2:
+                continue
+            
+            theta = self.cpts[node]
+            parent_states = [self.node_states[p] for p in self.parents[node]]
+            parent_labels = [', '.join(f'{p}={v}' for p, v in zip(self.parents[node], values))
+                             for values in product(*parent_states)]
+            
+            for k, query_state in enumerate(states):
+                # Quotient rule for P(target, e) / P(e)
+                derivative = ((derivatives[node][1 + k] * probability[0] -
+                               probability[1 + k] * derivatives[node][0]) / probability[0]**2)
+                
+                # Proportional co-variation of the other entries in the row
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    row_mean = (theta * derivative).sum(axis=-1, keepdims=True)
+                    covaried = np.where(theta < 1, (derivative - row_mean) / (1 - theta), np.nan)
+                
+                frames.append(pd.DataFrame({
+                    'query': f'{target}={query_state}',
+                    'node': node,
+                    'parents': np.repeat(parent_labels, len(self.node_states[node])),
+                    'state': np.tile(self.node_states[node], len(parent_labels)),
+                    'theta': theta.ravel(),
+                    'derivative': derivative.ravel(),
+                    'covaried_derivative': covaried.ravel()
+                }))
+        
+        table = pd.concat(frames, ignore_index=True)
+        order = np.argsort(-np.nan_to_num(np.abs(table['covaried_derivative'].to_numpy()), nan=-1.0),
+                           kind='stable')
+        
+        return table.iloc[order].reset_index(drop=True)
+
+def _ancestral_codes(topological_order, parents, cpts, n_samples, rng, indicators=None):
+    """
+    Vectorized ancestral sampling on compiled CPTs
+    
+    For each node in topological order, the parent code arrays select a row
+    of the node's cumulative table and one uniform per sample is compared
+    against it. Nodes in indicators ({node: 0/1 vector over its states}) are
+    clamped by likelihood weighting. Returns (codes, weights); weights is
+    None without indicators.
+    """
+    
+    codes = {}
+    weights = None if indicators is None else np.ones(n_samples)
+    
+    for node in topological_order:
+        cpt = cpts[node]
+        n_states = cpt.shape[-1]
+        table = cpt.reshape(-1, n_states)
+        
+        if parents[node]:
+            row = np.ravel_multi_index([codes[p] for p in parents[node]], cpt.shape[:-1])
+        else:
+            row = np.zeros(n_samples, dtype=np.int64)
+        
+        u = rng.random(n_samples)
+        
+        if indicators is not None and node in indicators:
+            allowed = table * indicators[node]
+            mass = allowed.sum(axis=1)
+            weights *= mass[row]
+            cumulative = np.cumsum(allowed, axis=1) / np.where(mass > 0, mass, 1)[:, None]
+            # Never land on a disallowed state through rounding at the top
+            u = u * cumulative[row, -1]
+        else:
+            cumulative = np.cumsum(table, axis=1)
+        
+        code = np.zeros(n_samples, dtype=np.int8)
+        for state in range(n_states - 1):
+            code += u >= cumulative[row, state]
+        codes[node] = code
+    
+    return codes, weights
+
+def _count_codes(codes, count_tables, node_states, weights=None):
+    """Contingency tables {nodes: array with one axis per node} of sampled codes"""
+    
+    tables = {}
+    for nodes in count_tables:
+        shape = tuple(len(node_states[node]) for node in nodes)
+        key = np.ravel_multi_index([codes[node] for node in nodes], shape)
+        tables[tuple(nodes)] = np.bincount(key, weights=weights, minlength=int(np.prod(shape))).reshape(shape)
+    
+    return tables
+
+def _sample_shard(model, n_samples, seed, count_tables, indicators=None,
+                  parquet_path=None, shard_index=0):
+    """
+    Sample one shard in a worker, optionally write it to Parquet, and reduce it to count tables
+    
+    model holds the compiled 'cpts', 'parents', 'topological_order' and
+    'node_states' of the network; indicators is the evidence as in
+    _ancestral_codes.
+    """
+    
+    codes, weights = _ancestral_codes(model['topological_order'], model['parents'], model['cpts'],
+                                      n_samples, np.random.default_rng(seed), indicators)
+    
+    if parquet_path is not None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing samples to Parquet requires pyarrow (pip install pyarrow)")
+        
+        shard = pd.DataFrame({
+            node: pd.Categorical.from_codes(codes[node], categories=model['node_states'][node])
+            for node in model['topological_order']
+        })
+        if weights is not None:
+            shard['Weight'] = weights
+        pq.write_table(pa.Table.from_pandas(shard, preserve_index=False),
+                       os.path.join(parquet_path, f"part-{shard_index:06d}.parquet"))
+    
+    return _count_codes(codes, count_tables, model['node_states'], weights)
 
 def run_bayesian_analysis():
     """Run comprehensive Bayesian network analysis"""
@@ -469,19 +1406,24 @@ def run_bayesian_analysis():
     print("-" * 30)
     
     # Carrier frequencies
-    mutation_counts = samples['mtDNA_Mutation'].value_counts()
+    mutation_counts = np.bincount(samples['mtDNA_Mutation'].cat.codes,
+                                  minlength=len(bn.node_states['mtDNA_Mutation']))
     total_samples = len(samples)
     
     for mutation in ['11778G>A', '14484T>C', '3460G>A']:
-        if mutation in mutation_counts:
-            frequency = (mutation_counts[mutation] / total_samples) * 100000
+        count = mutation_counts[bn.state_codes['mtDNA_Mutation'][mutation]]
+        if count > 0:
+            frequency = (count / total_samples) * 100000
             print(f"{mutation}: {frequency:.1f} per 100,000 (1 in {100000/frequency:.0f})")
+        else:
+            print(f"{mutation}: not observed in {total_samples:,} samples")
     
     # Penetrance analysis
     print("\nPenetrance Analysis:")
     print("-" * 20)
     
-    penetrance_results = bn.calculate_penetrance_by_subgroup(samples)
+    # Exact subgroup penetrances (no sampling noise)
+    penetrance_results = bn.calculate_penetrance_by_subgroup()
     
     for subgroup, penetrance in penetrance_results.items():
         print(f"{subgroup:<35} {penetrance*100:.1f}%")
@@ -490,16 +1432,49 @@ def run_bayesian_analysis():
     print("\nRecovery Analysis:")
     print("-" * 18)
     
-    recovery_results = bn.calculate_recovery_rates(samples)
+    recovery_results = bn.calculate_recovery_rates()
     
     for subgroup, rate in recovery_results.items():
         print(f"{subgroup:<35} {rate*100:.1f}%")
     
+    # Parameter uncertainty
+    print("\nParameter Uncertainty (1,000 Dirichlet CPT draws):")
+    print("-" * 50)
+    
+    interval_results = bn.ensemble_subgroup_table(n_draws=1000, concentration=100.0, random_state=42)
+    
+    for _, row in interval_results.iterrows():
+        print(f"{row['subgroup']:<35} {row['rate']*100:.1f}% "
+              f"(95% CrI {row['ci_low']*100:.1f}-{row['ci_high']*100:.1f}%)")
+    
+    # Parameter sensitivity of carrier penetrance
+    print("\nMost Influential CPT Entries (P(Affected | carrier)):")
+    print("-" * 52)
+    
+    sensitivity_results = bn.parameter_sensitivity(
+        'LHON_Phenotype', 'Affected', {'mtDNA_Mutation': ['11778G>A', '14484T>C', '3460G>A']})
+    
+    for _, row in sensitivity_results.head(10).iterrows():
+        print(f"{row['node']:<24} {row['state']:<14} {row['parents'][:40]:<40} "
+              f"{row['covaried_derivative']:+.4f}")
+    
+    # Most likely causes for an example case review
+    print("\nMost Likely Causes (affected male 11778G>A heavy smoker):")
+    print("-" * 56)
+    
+    causes, probability = bn.map(['Mitochondrial_Function', 'Oxidative_Stress', 'Liability'],
+                                 {'mtDNA_Mutation': '11778G>A', 'Sex': 'Male', 'Smoking': 'Heavy',
+                                  'LHON_Phenotype': 'Affected'})
+    
+    for node, state in causes.items():
+        print(f"{node:<24} {state}")
+    print(f"Posterior probability of this configuration: {probability*100:.1f}%")
+    
     # Population prevalence
     print("\nPopulation Prevalence:")
     print("-" * 22)
     
-    affected_count = (samples['LHON_Phenotype'] == 'Affected').sum()
+    affected_count = bn._is(samples, 'LHON_Phenotype', 'Affected').sum()
     prevalence_per_100k = (affected_count / total_samples) * 100000
     
     print(f"Modeled prevalence: {prevalence_per_100k:.2f} per 100,000")
@@ -525,12 +1500,22 @@ def run_bayesian_analysis():
     recovery_df.to_csv('/home/ubuntu/lhon_bayesian_recovery.csv', index=False)
     print("Saved: lhon_bayesian_recovery.csv")
     
+    # Save subgroup credible intervals
+    interval_results.to_csv('/home/ubuntu/lhon_bayesian_subgroup_intervals.csv', index=False)
+    print("Saved: lhon_bayesian_subgroup_intervals.csv")
+    
+    # Save parameter sensitivities
+    sensitivity_results.to_csv('/home/ubuntu/lhon_bayesian_parameter_sensitivity.csv', index=False)
+    print("Saved: lhon_bayesian_parameter_sensitivity.csv")
+    
     print("\nBayesian network analysis complete!")
     
     return {
         'samples': samples,
         'penetrance_results': penetrance_results,
         'recovery_results': recovery_results,
+        'interval_results': interval_results,
+        'sensitivity_results': sensitivity_results,
         'prevalence_per_100k': prevalence_per_100k
     }
 
@@ -0,0 +1,689 @@
+#!/usr/bin/env python3
+"""
+Exact Inference for the LHON Bayesian Network
+Variable elimination and junction trees over the compiled conditional probability tensors
+"""
+
+from collections import OrderedDict
+from itertools import combinations
+import numpy as np
+import pandas as pd
+
+def normalize_evidence(network, evidence):
+    """
+    Evidence as {node: tuple of allowed state codes}
+
+    Values may be a state name, an integer code, or a list/set of either;
+    a set of states means the node is known to be in one of them.
+    """
+
+    normalized = {}
+    for node, value in (evidence or {}).items():
+        if node not in network.state_codes:
+            raise ValueError(f"Unknown node {node}")
+
+        values = [value] if isinstance(value, (str, int, np.integer)) else list(value)
+        codes = set()
+        for v in values:
+            if isinstance(v, (int, np.integer)) and not isinstance(v, bool):
+                if not 0 <= v < len(network.node_states[node]):
+                    raise ValueError(f"State code {v} out of range for {node}")
+                codes.add(int(v))
+            elif v in network.state_codes[node]:
+                codes.add(network.state_codes[node][v])
+            else:
+                raise ValueError(f"Unknown state {v} for node {node}")
+
+        normalized[node] = tuple(sorted(codes))
+
+    return normalized
+
+def evidence_indicator(network, node, codes):
+    """0/1 vector over a node's states marking the allowed codes"""
+
+    indicator = np.zeros(len(network.node_states[node]))
+    indicator[list(codes)] = 1.0
+    return indicator
+
+def min_fill_order(neighbours, eliminate):
+    """
+    Greedy min-fill elimination order
+
+    neighbours maps every variable of the interaction graph to its
+    neighbours; only variables in `eliminate` are ordered. Ties are broken by
+    degree, then by name, so orders are deterministic.
+    """
+
+    graph = {v: set(n) for v, n in neighbours.items()}
+    remaining = set(eliminate)
+    order = []
+
+    def fill_in(v):
+        return sum(1 for a, b in combinations(graph[v], 2) if b not in graph[a])
+
+    while remaining:
+        v = min(remaining, key=lambda x: (fill_in(x), len(graph[x]), x))
+        for a, b in combinations(graph[v], 2):
+            graph[a].add(b)
+            graph[b].add(a)
+        for n in graph[v]:
+            graph[n].discard(v)
+        del graph[v]
+        remaining.discard(v)
+        order.append(v)
+
+    return order
+
+class VariableElimination:
+    """
+    Exact posterior queries on a compiled LHONBayesianNetwork
+
+    Nodes that are neither ancestors of the targets nor of the evidence are
+    pruned (they sum to one), evidence enters as 0/1 indicator factors, and
+    the remaining variables are summed out in min-fill order with einsum.
+    Elimination orders and query results are cached; factors may carry
+    leading batch axes, which broadcast through every product.
+    """
+
+    def __init__(self, network, cache_size=1024):
+        """Initialize from a network on which compile() has been run"""
+
+        self.network = network
+        self.index = {node: i for i, node in enumerate(network.topological_order)}
+        self.cache_size = cache_size
+        self._order_cache = {}
+        self._cache = OrderedDict()
+        self._joint_cache = OrderedDict()
+
+    def relevant_nodes(self, nodes):
+        """The given nodes and all their ancestors, in topological order"""
+
+        relevant = set()
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            if node not in relevant:
+                relevant.add(node)
+                stack.extend(self.network.parents[node])
+
+        return [node for node in self.network.topological_order if node in relevant]
+
+    def factors(self, nodes, evidence, cpts=None):
+        """CPT factors of the given nodes plus evidence indicator factors"""
+
+        if cpts is None:
+            cpts = self.network.cpts
+
+        factors = [(tuple(self.network.parents[node]) + (node,), cpts[node]) for node in nodes]
+        for node, codes in evidence.items():
+            if len(codes) < len(self.network.node_states[node]):
+                factors.append(((node,), evidence_indicator(self.network, node, codes)))
+
+        return factors
+
+    def _sublist(self, variables):
+        return [Ellipsis] + [self.index[v] for v in variables]
+
+    def _product(self, factors, keep):
+        """Multiply factors and sum out every variable not in keep, in one einsum"""
+
+        args = []
+        for variables, array in factors:
+            args.extend([array, self._sublist(variables)])
+        args.append(self._sublist(keep))
+
+        return np.einsum(*args, optimize=True)
+
+    def elimination_order(self, factors, targets):
+        """Cached min-fill order for summing out all non-target variables"""
+
+        scopes = tuple(sorted(set(variables for variables, _ in factors)))
+        key = (scopes, tuple(targets))
+        if key not in self._order_cache:
+            neighbours = {}
+            for variables in scopes:
+                for v in variables:
+                    neighbours.setdefault(v, set()).update(u for u in variables if u != v)
+            eliminate = [v for v in neighbours if v not in targets]
+            self._order_cache[key] = min_fill_order(neighbours, eliminate)
+
+        return self._order_cache[key]
+
+    def eliminate(self, factors, targets):
+        """
+        Unnormalized joint over targets after summing out everything else
+
+        Returns an array whose last axes follow `targets`.
+        """
+
+        factors = list(factors)
+        for v in self.elimination_order(factors, targets):
+            involved = [f for f in factors if v in f[0]]
+            factors = [f for f in factors if v not in f[0]]
+            scope = []
+            for variables, _ in involved:
+                scope.extend(u for u in variables if u != v and u not in scope)
+            factors.append((tuple(scope), self._product(involved, scope)))
+
+        return self._product(factors, targets)
+
+    def joint(self, targets, evidence=None, cpts=None):
+        """Unnormalized P(targets, evidence) with barren nodes pruned"""
+
+        evidence = normalize_evidence(self.network, evidence)
+        nodes = self.relevant_nodes(list(targets) + list(evidence))
+
+        return self.eliminate(self.factors(nodes, evidence, cpts), list(targets))
+
+    def query(self, target, evidence=None):
+        """
+        Exact posterior of one or more target nodes given evidence
+
+        Returns a Series indexed by the target's states (a MultiIndex over
+        the state combinations for several targets).
+        """
+
+        targets = [target] if isinstance(target, str) else list(target)
+        normalized = normalize_evidence(self.network, evidence)
+        key = (tuple(targets), tuple(sorted(normalized.items())))
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key].copy()
+
+        joint = self.joint(targets, normalized)
+        total = joint.sum()
+        if total <= 0:
+            raise ValueError(f"Evidence {evidence} has zero probability")
+
+        states = [self.network.node_states[t] for t in targets]
+        if len(targets) == 1:
+            index = pd.Index(states[0], name=targets[0])
+        else:
+            index = pd.MultiIndex.from_product(states, names=targets)
+        posterior = pd.Series((joint / total).ravel(), index=index, name='probability')
+
+        self._cache[key] = posterior
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return posterior.copy()
+
+    def _cached_joint(self, targets):
+        """LRU-cached unnormalized joint over the given nodes (no evidence)"""
+
+        key = tuple(targets)
+        if key in self._joint_cache:
+            self._joint_cache.move_to_end(key)
+        else:
+            self._joint_cache[key] = self.joint(list(targets))
+            if len(self._joint_cache) > self.cache_size:
+                self._joint_cache.popitem(last=False)
+
+        return self._joint_cache[key]
+
+    def _evidence_codes(self, evidence_table, evidence_nodes=None):
+        """(n_rows, n_evidence_nodes) code array and node list of an evidence table"""
+
+        if isinstance(evidence_table, pd.DataFrame):
+            evidence_nodes = list(evidence_table.columns)
+            columns = []
+            for node in evidence_nodes:
+                column = evidence_table[node]
+                if not pd.api.types.is_integer_dtype(column):
+                    column = column.map(self.network.state_codes[node])
+                    if column.isna().any():
+                        raise ValueError(f"Evidence table contains unknown states for {node}")
+                columns.append(column.to_numpy(dtype=np.int64))
+            codes = np.column_stack(columns) if columns else np.zeros((len(evidence_table), 0), dtype=np.int64)
+        else:
+            codes = np.asarray(evidence_table, dtype=np.int64).reshape(len(evidence_table), -1)
+            evidence_nodes = list(evidence_nodes or [])
+            if codes.shape[1] != len(evidence_nodes):
+                raise ValueError("evidence_nodes must name every column of the evidence array")
+
+        return codes, evidence_nodes
+
+    def query_batch(self, target, evidence_table, evidence_nodes=None):
+        """
+        Posteriors of a target node for many single-state evidence rows
+
+        evidence_table is a DataFrame whose columns are nodes and whose
+        values are state names or codes, or an integer code array whose
+        columns follow evidence_nodes. The joint of the evidence nodes and
+        the target is eliminated once (and kept in an LRU cache keyed by the
+        evidence nodes); every row is then a gather from it. Returns an
+        (n_rows, n_target_states) array; rows with zero-probability evidence
+        are NaN.
+        """
+
+        codes, evidence_nodes = self._evidence_codes(evidence_table, evidence_nodes)
+
+        if target in evidence_nodes:
+            raise ValueError(f"Target {target} cannot also be evidence")
+
+        joint = self._cached_joint(evidence_nodes + [target])
+        n_target = joint.shape[-1]
+        evidence_shape = joint.shape[joint.ndim - 1 - len(evidence_nodes):-1]
+        flat = joint.reshape(joint.shape[:joint.ndim - 1 - len(evidence_nodes)] + (-1, n_target))
+
+        rows = np.ravel_multi_index(tuple(codes.T), evidence_shape) if evidence_nodes else np.zeros(len(codes), dtype=np.int64)
+        selected = flat[..., rows, :]
+        totals = selected.sum(axis=-1, keepdims=True)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(totals > 0, selected / totals, np.nan)
+
+    def max_product(self, max_vars, evidence=None, keep=()):
+        """
+        Max-product elimination of max_vars, keeping `keep` as free axes
+
+        Variables that are neither maximized nor kept are summed out first
+        (so a subset of max_vars gives a MAP query); max_vars are then
+        maximized out in min-fill order, recording the argmax table of each.
+        Returns the table of maxima over `keep` and the traceback list of
+        (variable, scope, argmax array) in elimination order.
+        """
+
+        evidence = normalize_evidence(self.network, evidence)
+        max_vars, keep = list(max_vars), list(keep)
+
+        # Barren nodes only drop out when every non-evidence node is summed
+        if set(max_vars) | set(keep) | set(evidence) >= set(self.network.topological_order):
+            nodes = self.network.topological_order
+        else:
+            nodes = self.relevant_nodes(max_vars + keep + list(evidence))
+        factors = self.factors(nodes, evidence)
+
+        # Sum phase
+        for v in self.elimination_order(factors, max_vars + keep):
+            involved = [f for f in factors if v in f[0]]
+            factors = [f for f in factors if v not in f[0]]
+            scope = []
+            for variables, _ in involved:
+                scope.extend(u for u in variables if u != v and u not in scope)
+            factors.append((tuple(scope), self._product(involved, scope)))
+
+        # Max phase
+        traceback = []
+        for v in self.elimination_order(factors, keep):
+            involved = [f for f in factors if v in f[0]]
+            factors = [f for f in factors if v not in f[0]]
+            scope = []
+            for variables, _ in involved:
+                scope.extend(u for u in variables if u != v and u not in scope)
+            table = self._product(involved, scope + [v])
+            traceback.append((v, tuple(scope), table.argmax(axis=-1)))
+            factors.append((tuple(scope), table.max(axis=-1)))
+
+        return self._product(factors, keep), traceback
+
+    def map_batch(self, query_vars, evidence_table, evidence_nodes=None):
+        """
+        Most probable joint states of query_vars for many evidence rows
+
+        query_vars=None maximizes over every non-evidence node (MPE). The
+        elimination runs once with the evidence nodes kept as free axes;
+        each row is then a traceback through the argmax tables indexed by
+        its evidence codes. Returns ({query var: (n_rows,) codes},
+        (n_rows,) posterior probability of the assignment); rows with
+        zero-probability evidence get probability NaN.
+        """
+
+        codes, evidence_nodes = self._evidence_codes(evidence_table, evidence_nodes)
+        if query_vars is None:
+            query_vars = [n for n in self.network.topological_order if n not in evidence_nodes]
+        query_vars = [query_vars] if isinstance(query_vars, str) else list(query_vars)
+        if set(query_vars) & set(evidence_nodes):
+            raise ValueError("Query variables cannot also be evidence")
+
+        maxima, traceback = self.max_product(query_vars, keep=evidence_nodes)
+
+        assignment = {node: codes[:, k] for k, node in enumerate(evidence_nodes)}
+        for v, scope, argmax in reversed(traceback):
+            assignment[v] = argmax[tuple(assignment[u] for u in scope)] if scope else np.full(len(codes), argmax)
+
+        rows = tuple(codes.T)
+        evidence_probability = self._cached_joint(evidence_nodes)[rows] if evidence_nodes else self._cached_joint([]) * np.ones(len(codes))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probability = np.where(evidence_probability > 0,
+                                   (maxima[rows] if evidence_nodes else maxima) / evidence_probability, np.nan)
+
+        return {v: assignment[v] for v in query_vars}, probability
+
+    def map_query(self, query_vars, evidence=None):
+        """
+        Most probable joint states of query_vars given evidence
+
+        query_vars=None gives the most probable explanation over every
+        non-evidence node. Evidence may include sets of states. Returns
+        ({node: state}, posterior probability of that assignment).
+        """
+
+        normalized = normalize_evidence(self.network, evidence)
+        if query_vars is None:
+            query_vars = [n for n in self.network.topological_order if n not in normalized]
+        query_vars = [query_vars] if isinstance(query_vars, str) else list(query_vars)
+        if set(query_vars) & set(normalized):
+            raise ValueError("Query variables cannot also be evidence")
+
+        maximum, traceback = self.max_product(query_vars, normalized)
+        evidence_probability = self.joint([], normalized)
+        if evidence_probability <= 0:
+            raise ValueError(f"Evidence {evidence} has zero probability")
+
+        assignment = {}
+        for v, scope, argmax in reversed(traceback):
+            assignment[v] = int(argmax[tuple(assignment[u] for u in scope)])
+
+        states = {v: self.network.node_states[v][assignment[v]] for v in query_vars}
+        return states, float(maximum / evidence_probability)
+
+def moral_graph(network, nodes=None):
+    """Undirected moral graph {node: neighbours} of the network (or a node subset)"""
+
+    if nodes is None:
+        nodes = network.topological_order
+
+    neighbours = {node: set() for node in nodes}
+    for node in nodes:
+        family = [p for p in network.parents[node] if p in neighbours] + [node]
+        for a, b in combinations(family, 2):
+            neighbours[a].add(b)
+            neighbours[b].add(a)
+
+    return neighbours
+
+def elimination_cliques(neighbours, order):
+    """Cliques created by eliminating variables in the given order"""
+
+    graph = {v: set(n) for v, n in neighbours.items()}
+    cliques = []
+    for v in order:
+        cliques.append(frozenset(graph[v]) | {v})
+        for a, b in combinations(graph[v], 2):
+            graph[a].add(b)
+            graph[b].add(a)
+        for n in graph[v]:
+            graph[n].discard(v)
+        del graph[v]
+
+    return cliques
+
+class JunctionTree:
+    """
+    Shafer-Shenoy junction tree over a compiled LHONBayesianNetwork
+
+    The moral graph is triangulated with a min-fill order, the maximal
+    elimination cliques are joined by a maximum-weight spanning tree over
+    separator sizes (with empty separators between disconnected parts of the
+    graph), and each CPT is assigned to one clique containing its
+    family. Messages are cached per directed edge: changing the evidence on
+    one node only invalidates the messages flowing away from that node's
+    clique, so subsequent reads recompute just that part of the tree.
+    """
+
+    def __init__(self, network):
+        """Compile the junction tree of a network on which compile() has been run"""
+
+        self.network = network
+        self.index = {node: i for i, node in enumerate(network.topological_order)}
+
+        neighbours = moral_graph(network)
+        order = min_fill_order(neighbours, list(neighbours))
+        candidates = elimination_cliques(neighbours, order)
+        maximal = [c for c in candidates if not any(c < other for other in candidates)]
+        maximal = list(dict.fromkeys(maximal))
+
+        self.cliques = [tuple(sorted(c, key=self.index.get)) for c in maximal]
+        n_cliques = len(self.cliques)
+
+        # Maximum spanning tree over separator sizes (Kruskal); empty
+        # separators are kept so that a disconnected moral graph still gives
+        # one tree and clique 0 sees every component
+        edges = sorted(((len(set(self.cliques[i]) & set(self.cliques[j])), i, j)
+                        for i, j in combinations(range(n_cliques), 2)), reverse=True)
+        component = list(range(n_cliques))
+
+        def find(i):
+            while component[i] != i:
+                component[i] = component[component[i]]
+                i = component[i]
+            return i
+
+        self.tree = {i: [] for i in range(n_cliques)}
+        for weight, i, j in edges:
+            if find(i) != find(j):
+                component[find(i)] = find(j)
+                self.tree[i].append(j)
+                self.tree[j].append(i)
+
+        self.separators = {}
+        for i in self.tree:
+            for j in self.tree[i]:
+                self.separators[(i, j)] = tuple(v for v in self.cliques[i] if v in self.cliques[j])
+
+        # Cliques on the sending side of every directed edge
+        self.upstream = {}
+        for i, j in self.separators:
+            side = {i}
+            stack = [i]
+            while stack:
+                k = stack.pop()
+                for n in self.tree[k]:
+                    if n != j and n not in side:
+                        side.add(n)
+                        stack.append(n)
+            self.upstream[(i, j)] = side
+
+        # Each family goes to the smallest clique containing it; each node's
+        # evidence to the smallest clique containing the node
+        self.family_clique = {}
+        self.home_clique = {}
+        for node in network.topological_order:
+            family = set(network.parents[node]) | {node}
+            self.family_clique[node] = min((i for i in range(n_cliques) if family <= set(self.cliques[i])),
+                                           key=lambda i: len(self.cliques[i]))
+            self.home_clique[node] = min((i for i in range(n_cliques) if node in self.cliques[i]),
+                                         key=lambda i: len(self.cliques[i]))
+
+        self.set_parameters(network.cpts)
+
+    def _sublist(self, variables):
+        return [Ellipsis] + [self.index[v] for v in variables]
+
+    def _product(self, factors, keep):
+        args = []
+        for variables, array in factors:
+            args.extend([array, self._sublist(variables)])
+        args.append(self._sublist(keep))
+        return np.einsum(*args, optimize=True)
+
+    def set_parameters(self, cpts):
+        """(Re)build clique potentials from CPT tensors, clearing all evidence and messages"""
+
+        self.cpts = cpts
+        self.potentials = []
+        for i, clique in enumerate(self.cliques):
+            factors = [(tuple(self.network.parents[node]) + (node,), cpts[node])
+                       for node, home in self.family_clique.items() if home == i]
+            factors.append((clique, np.ones([len(self.network.node_states[v]) for v in clique])))
+            self.potentials.append(self._product(factors, clique))
+
+        self.evidence = {}
+        self.indicators = {}
+        self._messages = {}
+
+    def set_evidence(self, evidence=None):
+        """
+        Replace the current evidence, invalidating only the affected messages
+
+        Accepts the same evidence forms as LHONBayesianNetwork.query.
+        """
+
+        evidence = normalize_evidence(self.network, evidence)
+        changed = {node for node in set(evidence) | set(self.evidence)
+                   if evidence.get(node) != self.evidence.get(node)}
+
+        for node in changed:
+            home = self.home_clique[node]
+            for edge in [e for e in self._messages if home in self.upstream[e]]:
+                del self._messages[edge]
+
+        self.evidence = evidence
+        self.indicators = {node: evidence_indicator(self.network, node, codes)
+                           for node, codes in evidence.items()
+                           if len(codes) < len(self.network.node_states[node])}
+
+    def _local_factors(self, i, indicators):
+        """Potential and evidence indicators held by clique i"""
+
+        factors = [(self.cliques[i], self.potentials[i])]
+        factors.extend(((node,), indicator) for node, indicator in indicators.items()
+                       if self.home_clique[node] == i)
+        return factors
+
+    def _message(self, i, j, indicators, cache):
+        """Message from clique i to neighbouring clique j, memoized in cache"""
+
+        if (i, j) not in cache:
+            factors = self._local_factors(i, indicators)
+            factors.extend((self.separators[(k, i)], self._message(k, i, indicators, cache))
+                           for k in self.tree[i] if k != j)
+            cache[(i, j)] = self._product(factors, self.separators[(i, j)])
+
+        return cache[(i, j)]
+
+    def message(self, i, j):
+        """Message from clique i to neighbouring clique j under the current evidence (cached)"""
+
+        return self._message(i, j, self.indicators, self._messages)
+
+    def calibrate(self):
+        """Compute every missing message"""
+
+        for i, j in self.separators:
+            self.message(i, j)
+
+    def clique_belief(self, i, keep=None, indicators=None, cache=None):
+        """
+        Unnormalized clique belief, optionally summed down to keep
+
+        indicators and cache default to the current evidence and its cached
+        messages; batch_family_marginals passes its own.
+        """
+
+        if indicators is None:
+            indicators, cache = self.indicators, self._messages
+
+        factors = self._local_factors(i, indicators)
+        factors.extend((self.separators[(k, i)], self._message(k, i, indicators, cache)) for k in self.tree[i])
+        return self._product(factors, self.cliques[i] if keep is None else keep)
+
+    def probability_of_evidence(self):
+        """P(evidence) under the current parameters"""
+
+        return self.clique_belief(0, ())
+
+    def joint_marginal(self, nodes):
+        """
+        Unnormalized P(nodes, evidence) for nodes that share a clique
+
+        Returns None when no clique contains all of them.
+        """
+
+        containing = [i for i, c in enumerate(self.cliques) if set(nodes) <= set(c)]
+        if not containing:
+            return None
+        return self.clique_belief(min(containing, key=lambda i: len(self.cliques[i])), tuple(nodes))
+
+    def family_marginal(self, node):
+        """Unnormalized P(parents, node, evidence) with axes as in the node's CPT"""
+
+        family = tuple(self.network.parents[node]) + (node,)
+        return self.clique_belief(self.family_clique[node], family)
+
+    def batch_family_marginals(self, indicators, nodes=None):
+        """
+        Family marginals for a batch of evidence configurations in one pass
+
+        indicators maps evidence nodes to (B, n_states) likelihood arrays
+        (one-hot rows for hard evidence). Every message carries the leading
+        batch axis. Returns ({node: (B, *CPT shape) unnormalized
+        P(family, evidence)}, (B,) P(evidence)); the current evidence and
+        its cached messages are left untouched.
+        """
+
+        if nodes is None:
+            nodes = self.network.topological_order
+
+        cache = {}
+        marginals = {node: self.clique_belief(self.family_clique[node],
+                                              tuple(self.network.parents[node]) + (node,),
+                                              indicators, cache)
+                     for node in nodes}
+        evidence_probability = self.clique_belief(0, (), indicators, cache)
+
+        return marginals, evidence_probability
+
+    def batch_parameter_derivatives(self, indicators, nodes=None):
+        """
+        Partial derivatives of P(evidence) with respect to every CPT entry
+
+        P(evidence) is multilinear in the CPT entries, so dP(e)/dtheta_{x|u}
+        is the family clique belief with the node's own CPT left out of the
+        clique potential (equal to P(x, u, e) / theta_{x|u} where theta > 0,
+        and still defined where theta = 0). indicators are batched as in
+        batch_family_marginals and the messages are shared across nodes, so
+        all derivatives cost about one calibration. Returns ({node: (B, *CPT
+        shape)}, (B,) P(evidence)).
+        """
+
+        if nodes is None:
+            nodes = self.network.topological_order
+
+        cache = {}
+        derivatives = {}
+        for node in nodes:
+            i = self.family_clique[node]
+            family = tuple(self.network.parents[node]) + (node,)
+
+            factors = [(tuple(self.network.parents[other]) + (other,), self.cpts[other])
+                       for other, home in self.family_clique.items() if home == i and other != node]
+            factors.append((family, np.ones(self.cpts[node].shape[-len(family):])))
+            factors.extend(((v,), indicator) for v, indicator in indicators.items() if self.home_clique[v] == i)
+            factors.extend((self.separators[(k, i)], self._message(k, i, indicators, cache)) for k in self.tree[i])
+
+            derivatives[node] = self._product(factors, family)
+
+        return derivatives, self.clique_belief(0, (), indicators, cache)
+
+    def marginal(self, node):
+        """Posterior of a single node as a Series over its states"""
+
+        belief = self.joint_marginal([node])
+        return pd.Series(belief / belief.sum(), index=pd.Index(self.network.node_states[node], name=node),
+                         name='probability')
+
+    def pairwise(self, a, b):
+        """
+        Posterior joint of two nodes as a DataFrame (rows a, columns b)
+
+        Pairs outside a common clique are obtained by conditioning on each
+        state of a, which only recomputes the messages leaving a's clique.
+        """
+
+        joint = self.joint_marginal([a, b])
+        if joint is None:
+            saved = self.evidence
+            prior_a = self.joint_marginal([a])
+            joint = np.zeros((len(self.network.node_states[a]), len(self.network.node_states[b])))
+            for code in np.flatnonzero(prior_a > 0):
+                self.set_evidence({**saved, a: code})
+                belief_b = self.joint_marginal([b])
+                joint[code] = prior_a[code] * belief_b / belief_b.sum()
+            self.set_evidence(saved)
+
+        return pd.DataFrame(joint / joint.sum(),
+                            index=pd.Index(self.network.node_states[a], name=a),
+                            columns=pd.Index(self.network.node_states[b], name=b))
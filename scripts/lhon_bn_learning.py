@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Structure Learning for the LHON Bayesian Network
+Score-based hill-climbing / tabu search over DAGs with cached family scores
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.special import gammaln
+
+# Data shared with worker processes (set once per worker by _init_worker)
+_WORKER_STATE = {}
+
+def _init_worker(codes, cardinalities, score, equivalent_sample_size):
+    _WORKER_STATE.update(codes=codes, cardinalities=cardinalities, score=score,
+                         equivalent_sample_size=equivalent_sample_size)
+
+def _worker_family_score(family):
+    child, parents = family
+    return family_score(_WORKER_STATE['codes'], _WORKER_STATE['cardinalities'], child, parents,
+                        _WORKER_STATE['score'], _WORKER_STATE['equivalent_sample_size'])
+
+def family_counts(codes, cardinalities, child, parents):
+    """(n_parent_configurations, n_child_states) counts via one bincount over mixed-radix codes"""
+
+    key = np.zeros(codes.shape[0], dtype=np.int64)
+    for p in parents:
+        key *= cardinalities[p]
+        key += codes[:, p]
+    key *= cardinalities[child]
+    key += codes[:, child]
+
+    q = int(np.prod([cardinalities[p] for p in parents])) if parents else 1
+    return np.bincount(key, minlength=q * cardinalities[child]).reshape(q, cardinalities[child])
+
+def family_score(codes, cardinalities, child, parents, score='bic', equivalent_sample_size=1.0):
+    """Decomposable BIC or BDeu score of one family (child given parents)"""
+
+    counts = family_counts(codes, cardinalities, child, parents).astype(np.float64)
+    q, r = counts.shape
+    row_totals = counts.sum(axis=1)
+
+    if score == 'bic':
+        observed = counts > 0
+        log_likelihood = np.sum(counts[observed] *
+                                np.log(counts[observed] / np.broadcast_to(row_totals[:, None], counts.shape)[observed]))
+        return log_likelihood - 0.5 * np.log(codes.shape[0]) * q * (r - 1)
+
+    if score == 'bdeu':
+        alpha_row = equivalent_sample_size / q
+        alpha_cell = equivalent_sample_size / (q * r)
+        return (np.sum(gammaln(alpha_row) - gammaln(alpha_row + row_totals)) +
+                np.sum(gammaln(alpha_cell + counts) - gammaln(alpha_cell)))
+
+    raise ValueError(f"Unknown score {score}; use 'bic' or 'bdeu'")
+
+class HillClimbSearch:
+    """
+    Greedy hill-climbing with an optional tabu list over DAG structures
+
+    Moves are single-edge additions, removals and reversals subject to
+    acyclicity, max_indegree and forbidden edges. Scores decompose over
+    families, so each move is evaluated as a difference of at most two
+    family scores; family scores are cached by (child, parent set) and only
+    families touched by the last move need scoring in the next round. Those
+    are scored in a process pool when workers > 1. With tabu_length > 0 the
+    search keeps taking the best non-tabu move after reaching a local
+    optimum, for up to `patience` non-improving steps, and returns the best
+    structure seen.
+    """
+
+    def __init__(self, codes, nodes, cardinalities, score='bic', equivalent_sample_size=1.0,
+                 max_indegree=4, forbidden_edges=None, workers=1):
+        """Initialize from an (n_rows, n_nodes) code array with one column per node"""
+
+        self.codes = np.ascontiguousarray(codes, dtype=np.int64)
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.cardinalities = [int(c) for c in cardinalities]
+        self.score = score
+        self.equivalent_sample_size = equivalent_sample_size
+        self.max_indegree = max_indegree
+        self.forbidden = {(self.index[u], self.index[v]) for u, v in (forbidden_edges or [])}
+        self.workers = workers
+        self.cache = {}
+
+    @classmethod
+    def from_network(cls, network, data, **kwargs):
+        """Search over the network's nodes using fully observed records"""
+
+        codes = np.column_stack([network._codes(data, node) if node in data
+                                 else np.zeros(len(data), dtype=np.int64)
+                                 for node in network.topological_order])
+        if (codes < 0).any():
+            raise ValueError("Structure learning needs complete data; impute or drop missing values first")
+
+        cardinalities = [len(network.node_states[node]) for node in network.topological_order]
+        return cls(codes, network.topological_order, cardinalities, **kwargs)
+
+    def _score_families(self, families, executor=None):
+        """Fill the cache for all families not yet scored"""
+
+        missing = [f for f in dict.fromkeys(families) if f not in self.cache]
+        if not missing:
+            return
+
+        if executor is not None:
+            scores = executor.map(_worker_family_score, missing, chunksize=max(1, len(missing) // (4 * self.workers)))
+        else:
+            scores = (family_score(self.codes, self.cardinalities, child, parents,
+                                   self.score, self.equivalent_sample_size) for child, parents in missing)
+
+        for family, value in zip(missing, scores):
+            self.cache[family] = value
+
+    def _reaches(self, parents, start, target):
+        """Whether target is reachable from start following child -> parent links in reverse"""
+
+        # parents[v] lists parents of v; walk downward via children
+        children = {v: [] for v in range(len(self.nodes))}
+        for v, ps in parents.items():
+            for p in ps:
+                children[p].append(v)
+
+        stack = [start]
+        seen = set()
+        while stack:
+            v = stack.pop()
+            if v == target:
+                return True
+            if v not in seen:
+                seen.add(v)
+                stack.extend(children[v])
+        return False
+
+    def _moves(self, parents):
+        """All legal single-edge moves as (kind, u, v) with the families they change"""
+
+        moves = []
+        for v in range(len(self.nodes)):
+            for u in range(len(self.nodes)):
+                if u == v:
+                    continue
+                if u in parents[v]:
+                    # Remove u -> v
+                    moves.append((('remove', u, v), [(v, tuple(p for p in parents[v] if p != u))]))
+                    # Reverse u -> v into v -> u
+                    if ((v, u) not in self.forbidden and len(parents[u]) < self.max_indegree):
+                        trial = {k: list(ps) for k, ps in parents.items()}
+                        trial[v].remove(u)
+                        if not self._reaches(trial, u, v):
+                            moves.append((('reverse', u, v), [(v, tuple(p for p in parents[v] if p != u)),
+                                                               (u, tuple(sorted(parents[u] + [v])))]))
+                elif (u, v) not in self.forbidden and len(parents[v]) < self.max_indegree:
+                    # Add u -> v unless v already reaches u
+                    if not self._reaches(parents, v, u):
+                        moves.append((('add', u, v), [(v, tuple(sorted(parents[v] + [u])))]))
+        return moves
+
+    def search(self, start=None, max_iter=1000, tabu_length=0, patience=10, tol=1e-8):
+        """
+        Run the search from a start structure ({node: [parents]}, default empty)
+
+        Returns a dict with the best 'structure' ({node: [parents]} in node
+        order), its 'score', the per-step 'score_history' and the 'moves'
+        applied.
+        """
+
+        parents = {i: [] for i in range(len(self.nodes))}
+        for node, ps in (start or {}).items():
+            parents[self.index[node]] = sorted(self.index[p] for p in ps)
+
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                           initargs=(self.codes, self.cardinalities, self.score,
+                                                     self.equivalent_sample_size))
+
+        try:
+            self._score_families([(v, tuple(ps)) for v, ps in parents.items()], executor)
+            current = sum(self.cache[(v, tuple(ps))] for v, ps in parents.items())
+            best_score, best_parents = current, {v: list(ps) for v, ps in parents.items()}
+            history, applied, tabu = [current], [], []
+            stale = 0
+
+            for _ in range(max_iter):
+                moves = self._moves(parents)
+                self._score_families([family for _, families in moves for family in families], executor)
+
+                candidates = []
+                for move, families in moves:
+                    if tabu_length and move in tabu:
+                        continue
+                    delta = sum(self.cache[(child, ps)] - self.cache[(child, tuple(parents[child]))]
+                                for child, ps in families)
+                    candidates.append((delta, move, families))
+
+                if not candidates:
+                    break
+
+                delta, move, families = max(candidates, key=lambda c: c[0])
+                if delta <= tol and (not tabu_length or stale >= patience):
+                    break
+
+                for child, ps in families:
+                    parents[child] = list(ps)
+                current += delta
+                history.append(current)
+                applied.append((move[0], self.nodes[move[1]], self.nodes[move[2]]))
+
+                if tabu_length:
+                    # Forbid undoing this move for a while
+                    kind, u, v = move
+                    undo = {'add': ('remove', u, v), 'remove': ('add', u, v), 'reverse': ('reverse', v, u)}[kind]
+                    tabu.append(undo)
+                    tabu = tabu[-tabu_length:]
+
+                if current > best_score + tol:
+                    best_score, best_parents = current, {v: list(ps) for v, ps in parents.items()}
+                    stale = 0
+                else:
+                    stale += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return {
+            'structure': {self.nodes[v]: [self.nodes[p] for p in sorted(ps)] for v, ps in sorted(best_parents.items())},
+            'score': best_score,
+            'score_history': history,
+            'moves': applied
+        }
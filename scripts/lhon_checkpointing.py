@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Checkpointing utilities for long-running LHON simulations
+Persists completed replicate blocks, aggregator state and RNG positions so
+interrupted Monte Carlo and sensitivity runs can be resumed
+"""
+
+import os
+import glob
+import pickle
+import hashlib
+import numpy as np
+
+def settings_digest(*values):
+    """
+    Stable SHA-256 digest of model settings for checkpoint configs
+
+    Arrays contribute their dtype, shape and bytes; dicts, lists and tuples
+    are walked in order (dicts by sorted key); other objects contribute
+    their attributes, and scalars their repr. None digests to None so an
+    unset component stays readable in the config.
+    """
+
+    if len(values) == 1 and values[0] is None:
+        return None
+
+    digest = hashlib.sha256()
+
+    def update(value):
+        if isinstance(value, np.ndarray):
+            digest.update(f"array{value.dtype}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, dict):
+            digest.update(b"dict")
+            for key in sorted(value, key=repr):
+                update(key)
+                update(value[key])
+        elif isinstance(value, (list, tuple)):
+            digest.update(f"seq{len(value)}".encode())
+            for item in value:
+                update(item)
+        elif hasattr(value, '__dict__'):
+            digest.update(type(value).__name__.encode())
+            update(vars(value))
+        else:
+            digest.update(repr(value).encode())
+
+    for value in values:
+        update(value)
+
+    return digest.hexdigest()
+
+class RunCheckpointer:
+    """
+    Periodic on-disk checkpoints for replicate loops driven by the global NumPy RNG
+
+    Each completed block of replicate records is written to its own file, so a
+    checkpoint only costs the size of the new block. A small state file records
+    how many blocks are complete, the index of the next replicate, the RNG state
+    at that point and any running aggregator values. The state file is written
+    last and atomically, so an interruption mid-write leaves the previous
+    checkpoint intact.
+    """
+
+    def __init__(self, checkpoint_dir, run_name, config=None):
+        """Set up a checkpoint location for one named run"""
+
+        self.checkpoint_dir = checkpoint_dir
+        self.run_name = run_name
+        self.config = config if config is not None else {}
+        self.n_blocks = 0
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _state_path(self):
+        return os.path.join(self.checkpoint_dir, f"{self.run_name}_state.pkl")
+
+    def _block_path(self, block_index):
+        return os.path.join(self.checkpoint_dir, f"{self.run_name}_block_{block_index:06d}.pkl")
+
+    def _atomic_dump(self, obj, path):
+        """Write a pickle next to its target and move it into place"""
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """Remove any existing checkpoint files for this run"""
+
+        pattern = os.path.join(self.checkpoint_dir, f"{self.run_name}_*.pkl*")
+        for path in glob.glob(pattern):
+            os.remove(path)
+        self.n_blocks = 0
+
+    def save(self, next_index, block_records, aggregator=None):
+        """Checkpoint a completed block of replicates and the current run state"""
+
+        self._atomic_dump(block_records, self._block_path(self.n_blocks))
+        self.n_blocks += 1
+
+        state = {
+            'config': self.config,
+            'n_blocks': self.n_blocks,
+            'next_index': next_index,
+            'rng_state': np.random.get_state(),
+            'aggregator': aggregator
+        }
+        self._atomic_dump(state, self._state_path())
+
+    def load(self):
+        """
+        Load the latest checkpoint, restoring the global RNG to its saved position
+
+        Returns None when no checkpoint exists. Otherwise returns a dict with
+        'next_index', 'records' (all completed replicate records in order) and
+        'aggregator'.
+        """
+
+        state_path = self._state_path()
+        if not os.path.exists(state_path):
+            return None
+
+        with open(state_path, 'rb') as f:
+            state = pickle.load(f)
+
+        if state['config'] != self.config:
+            raise ValueError(
+                f"Checkpoint in {self.checkpoint_dir} was written for a different "
+                f"configuration of '{self.run_name}': {state['config']} != {self.config}"
+            )
+
+        # Blocks beyond n_blocks were written after the last state file and are ignored
+        records = []
+        for block_index in range(state['n_blocks']):
+            with open(self._block_path(block_index), 'rb') as f:
+                records.extend(pickle.load(f))
+
+        self.n_blocks = state['n_blocks']
+        np.random.set_state(state['rng_state'])
+
+        return {
+            'next_index': state['next_index'],
+            'records': records,
+            'aggregator': state['aggregator']
+        }
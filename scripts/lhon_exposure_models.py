@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Continuous Exposure Models for LHON Liability
+Correlated pack-years and drinks-per-week with tabulated dose-response curves
+"""
+
+import numpy as np
+from scipy import stats
+from scipy.interpolate import PchipInterpolator
+
+class DoseResponseCurve:
+    """
+    Liability contribution of a continuous dose, tabulated on a uniform grid
+
+    The curve is a monotone cubic (PCHIP) spline through (dose, log OR)
+    knots, held flat beyond the last knot. It is evaluated once on a fine
+    grid at construction; lookups are a single index into that table.
+    """
+
+    def __init__(self, knots, log_ors, max_dose=None, grid_size=4096):
+        """Tabulate the spline through the given knots"""
+
+        knots = np.asarray(knots, dtype=np.float64)
+        log_ors = np.asarray(log_ors, dtype=np.float64)
+
+        self.knots = knots
+        self.log_ors = log_ors
+        self.max_dose = max_dose if max_dose is not None else 2 * knots[-1]
+
+        grid = np.linspace(0, self.max_dose, grid_size)
+        spline = PchipInterpolator(knots, log_ors, extrapolate=False)
+        self.table = np.where(grid <= knots[-1], spline(np.minimum(grid, knots[-1])), log_ors[-1])
+        self.inv_step = (grid_size - 1) / self.max_dose
+
+    @classmethod
+    def log_linear(cls, slope, max_dose, grid_size=4096):
+        """Curve slope * log(1 + dose), tabulated up to max_dose"""
+
+        curve = cls([0.0, max_dose], [0.0, slope * np.log1p(max_dose)], max_dose, grid_size)
+        grid = np.linspace(0, max_dose, grid_size)
+        curve.table = slope * np.log1p(grid)
+        return curve
+
+    def __call__(self, dose):
+        """Liability contribution for an array of doses (clipped to [0, max_dose])"""
+
+        dose = np.clip(np.asarray(dose, dtype=np.float64), 0, self.max_dose)
+        index = np.minimum((dose * self.inv_step).astype(np.int64), len(self.table) - 1)
+        return self.table[index]
+
+class CorrelatedExposureModel:
+    """
+    Jointly distributed pack-years and drinks per week
+
+    Each exposure is zero with probability 1 - prevalence and lognormal
+    otherwise. The two are coupled through a Gaussian copula with the given
+    correlation, so heavier smokers tend to be heavier drinkers. Exposure
+    levels (none/light/heavy) for stratified summaries use the heavy
+    thresholds. Defaults match the categorical exposure prevalences of the
+    population model (60% smokers, 30% of them heavy; 90% drinkers, 20% of
+    them heavy) and are calibrated so that typical light and heavy doses
+    reproduce the Kirkman et al. odds ratios.
+    """
+
+    def __init__(self, correlation=0.3,
+                 smoking_prevalence=0.6, pack_years_median=12.0, pack_years_sigma=0.9,
+                 heavy_pack_years=20.0,
+                 drinking_prevalence=0.9, drinks_median=6.0, drinks_sigma=1.0,
+                 heavy_drinks=14.0,
+                 smoking_curve=None, alcohol_curve=None):
+        """Initialize marginals, copula correlation and dose-response curves"""
+
+        self.correlation = correlation
+        self.smoking_prevalence = smoking_prevalence
+        self.pack_years_median = pack_years_median
+        self.pack_years_sigma = pack_years_sigma
+        self.heavy_pack_years = heavy_pack_years
+        self.drinking_prevalence = drinking_prevalence
+        self.drinks_median = drinks_median
+        self.drinks_sigma = drinks_sigma
+        self.heavy_drinks = heavy_drinks
+
+        if smoking_curve is None:
+            smoking_curve = DoseResponseCurve([0, 8, 35], [0, np.log(1.54), np.log(3.16)], max_dose=150)
+        if alcohol_curve is None:
+            alcohol_curve = DoseResponseCurve([0, 5, 25], [0, np.log(1.01), np.log(3.27)], max_dose=150)
+
+        self.smoking_curve = smoking_curve
+        self.alcohol_curve = alcohol_curve
+
+    def _marginal(self, u, prevalence, median, sigma):
+        """Zero-inflated lognormal quantile function applied to copula uniforms"""
+
+        exposed = u > 1 - prevalence
+        v = np.clip((u - (1 - prevalence)) / max(prevalence, 1e-300), 1e-12, 1 - 1e-12)
+        return np.where(exposed, median * np.exp(sigma * stats.norm.ppf(v)), 0.0)
+
+    def sample(self, n, rng):
+        """
+        Draw exposures for n individuals
+
+        Returns a dict with 'pack_years', 'drinks_per_week', their none/light/
+        heavy level codes 'smoking' and 'alcohol', and the combined
+        dose-response 'liability' contribution.
+        """
+
+        z_smoking = rng.standard_normal(n)
+        z_alcohol = (self.correlation * z_smoking +
+                     np.sqrt(1 - self.correlation**2) * rng.standard_normal(n))
+
+        pack_years = self._marginal(stats.norm.cdf(z_smoking), self.smoking_prevalence,
+                                    self.pack_years_median, self.pack_years_sigma)
+        drinks = self._marginal(stats.norm.cdf(z_alcohol), self.drinking_prevalence,
+                                self.drinks_median, self.drinks_sigma)
+
+        smoking = np.where(pack_years > 0, np.where(pack_years >= self.heavy_pack_years, 2, 1), 0)
+        alcohol = np.where(drinks > 0, np.where(drinks >= self.heavy_drinks, 2, 1), 0)
+
+        return {
+            'pack_years': pack_years,
+            'drinks_per_week': drinks,
+            'smoking': smoking,
+            'alcohol': alcohol,
+            'liability': self.smoking_curve(pack_years) + self.alcohol_curve(drinks)
+        }
+
+    def sample_given_levels(self, smoking, alcohol, rng):
+        """
+        Draw exposures conditional on given none/light/heavy level codes
+
+        Rejection by level cell: batches are drawn from sample() and each
+        individual takes the next draw that falls in their smoking x alcohol
+        cell, so accepted doses follow the model's conditional distribution.
+        Level codes outside 0-2 or cells the model gives no probability
+        (no draws in the reference sample of level_table) raise ValueError
+        instead of rejecting forever. Returns the same dict as sample().
+        """
+
+        smoking = np.asarray(smoking, dtype=np.int64)
+        alcohol = np.asarray(alcohol, dtype=np.int64)
+        if np.any((smoking < 0) | (smoking > 2) | (alcohol < 0) | (alcohol > 2)):
+            raise ValueError("Exposure level codes must be 0 (none), 1 (light) or 2 (heavy)")
+        cell = 3 * smoking + alcohol
+
+        probabilities, _ = self.level_table(n_nodes=1)
+        impossible = [c for c in np.unique(cell) if probabilities.ravel()[c] == 0]
+        if impossible:
+            levels = ['none', 'light', 'heavy']
+            raise ValueError("Exposure cells with zero probability under the model: " +
+                             ", ".join(f"smoking={levels[c // 3]}/alcohol={levels[c % 3]}" for c in impossible))
+        pack_years = np.empty(len(cell))
+        drinks = np.empty(len(cell))
+        pending = np.arange(len(cell))
+
+        while pending.size:
+            draw = self.sample(4 * pending.size + 1024, rng)
+            draw_cell = 3 * draw['smoking'] + draw['alcohol']
+            filled = np.zeros(pending.size, dtype=bool)
+
+            for c in np.unique(cell[pending]):
+                wanted = np.nonzero(cell[pending] == c)[0]
+                matches = np.nonzero(draw_cell == c)[0][:len(wanted)]
+                wanted = wanted[:len(matches)]
+                pack_years[pending[wanted]] = draw['pack_years'][matches]
+                drinks[pending[wanted]] = draw['drinks_per_week'][matches]
+                filled[wanted] = True
+
+            pending = pending[~filled]
+
+        return {
+            'pack_years': pack_years,
+            'drinks_per_week': drinks,
+            'smoking': smoking,
+            'alcohol': alcohol,
+            'liability': self.smoking_curve(pack_years) + self.alcohol_curve(drinks)
+        }
+
+    def level_table(self, n_nodes=8, n_samples=200000, seed=0):
+        """
+        Joint level distribution and within-level liability nodes
+
+        From a fixed reference sample, returns (probabilities, nodes):
+        probabilities is the (3, 3) joint distribution of smoking x alcohol
+        levels, nodes an (3, 3, n_nodes) array of equally weighted quantiles
+        of the dose-response liability within each cell, for averaging
+        penetrance over the doses of a level. Empty cells get zero nodes.
+        """
+
+        draw = self.sample(n_samples, np.random.default_rng(seed))
+        cell = 3 * draw['smoking'] + draw['alcohol']
+
+        probabilities = np.bincount(cell, minlength=9).reshape(3, 3) / n_samples
+        nodes = np.zeros((9, n_nodes))
+        quantiles = (np.arange(n_nodes) + 0.5) / n_nodes
+        for c in np.unique(cell):
+            nodes[c] = np.quantile(draw['liability'][cell == c], quantiles)
+
+        return probabilities, nodes.reshape(3, 3, n_nodes)
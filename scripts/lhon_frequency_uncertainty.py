@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+gnomAD Carrier Frequency Uncertainty for LHON Models
+Builds Beta posteriors for carrier frequencies from gnomAD allele counts
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+GNOMAD_SUMMARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   '..', 'data', 'gnomad_data_summary.csv')
+
+def read_allele_counts(path=GNOMAD_SUMMARY_PATH):
+    """{mutation: (AC, AN)} from a gnomAD summary table, AC = homoplasmic + heteroplasmic"""
+
+    summary = pd.read_csv(path)
+    allele_counts = {}
+    for _, row in summary.iterrows():
+        ac = int(row['Homoplasmic_AC']) + int(row['Heteroplasmic_AC'])
+        allele_counts[row['Mutation']] = (ac, int(row['Total_Allele_Number']))
+
+    return allele_counts
+
+class GnomADFrequencyPosterior:
+    """
+    Beta posterior distributions of LHON carrier frequencies
+
+    With allele count AC out of allele number AN and a Beta(a, b) prior, the
+    carrier frequency has posterior Beta(AC + a, AN - AC + b). The default
+    prior is Jeffreys' Beta(0.5, 0.5). All frequencies are reported per
+    100,000, the unit used throughout the models.
+    """
+
+    def __init__(self, allele_counts=None, prior=(0.5, 0.5)):
+        """Initialize from a {mutation: (AC, AN)} mapping (default: data/gnomad_data_summary.csv)"""
+
+        if allele_counts is None:
+            allele_counts = read_allele_counts()
+
+        self.allele_counts = dict(allele_counts)
+        self.prior = prior
+        self.mutations = list(self.allele_counts.keys())
+
+        ac = np.array([self.allele_counts[m][0] for m in self.mutations], dtype=np.float64)
+        an = np.array([self.allele_counts[m][1] for m in self.mutations], dtype=np.float64)
+
+        self.alpha = ac + prior[0]
+        self.beta = an - ac + prior[1]
+
+    @classmethod
+    def from_csv(cls, path=GNOMAD_SUMMARY_PATH, prior=(0.5, 0.5)):
+        """Build posteriors from a gnomAD summary table"""
+
+        return cls(read_allele_counts(path), prior)
+
+    def point_estimates(self):
+        """Maximum-likelihood carrier frequencies (AC / AN) per 100,000"""
+
+        return {m: ac / an * 100000 for m, (ac, an) in self.allele_counts.items()}
+
+    def summary(self, ci=0.95):
+        """Posterior mean and credible interval per mutation, per 100,000"""
+
+        tail = (1 - ci) / 2
+        return pd.DataFrame({
+            'allele_count': [self.allele_counts[m][0] for m in self.mutations],
+            'allele_number': [self.allele_counts[m][1] for m in self.mutations],
+            'posterior_mean_per_100k': self.alpha / (self.alpha + self.beta) * 100000,
+            'ci_low_per_100k': stats.beta.ppf(tail, self.alpha, self.beta) * 100000,
+            'ci_high_per_100k': stats.beta.ppf(1 - tail, self.alpha, self.beta) * 100000
+        }, index=self.mutations)
+
+    def sample(self, n_draws, rng=None, mutations=None):
+        """
+        Draw carrier frequencies per 100,000 from the posteriors
+
+        Returns an (n_draws, n_mutations) array whose columns follow mutations
+        (default: self.mutations). rng may be a numpy Generator or the
+        np.random module, so callers on the global RNG stay reproducible.
+        """
+
+        if rng is None:
+            rng = np.random
+        if mutations is None:
+            mutations = self.mutations
+
+        index = [self.mutations.index(m) for m in mutations]
+        return rng.beta(self.alpha[index], self.beta[index], size=(n_draws, len(index))) * 100000
+
+    def sample_dicts(self, n_draws, rng=None):
+        """Posterior draws as a list of {mutation: frequency per 100,000} dicts"""
+
+        draws = self.sample(n_draws, rng)
+        return [dict(zip(self.mutations, row)) for row in draws]
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Mitochondrial Haplogroup Tree for LHON Models
+PhyloTree-style haplogroup hierarchy with inherited, pre-resolved effect sizes
+"""
+
+import numpy as np
+import pandas as pd
+
+# Skeleton of the mtDNA phylogeny (child: parent) covering the haplogroups
+# referred to by the models; full PhyloTree tables can be loaded with from_csv
+DEFAULT_HAPLOGROUP_PARENTS = {
+    'mt-MRCA': None,
+    'L0': 'mt-MRCA', 'L1': 'mt-MRCA', 'L2': 'mt-MRCA', 'L3': 'mt-MRCA',
+    'L2a': 'L2', 'L2b': 'L2',
+    'M': 'L3', 'N': 'L3',
+    'C': 'M', 'D': 'M', 'G': 'M',
+    'A': 'N', 'I': 'N', 'W': 'N', 'X': 'N', 'R': 'N',
+    'B': 'R', 'F': 'R', 'HV': 'R', 'JT': 'R', 'U': 'R',
+    'H': 'HV', 'V': 'HV',
+    'H1': 'H', 'H2': 'H', 'H3': 'H', 'H5': 'H',
+    'J': 'JT', 'T': 'JT',
+    'J1': 'J', 'J2': 'J',
+    'J1b': 'J1', 'J1c': 'J1', 'J2a': 'J2', 'J2b': 'J2',
+    'T1': 'T', 'T2': 'T',
+    'U5': 'U', 'U8': 'U', 'K': 'U8',
+    'K1': 'K', 'K2': 'K'
+}
+
+class HaplogroupTree:
+    """
+    Rooted haplogroup hierarchy with O(1) per-individual effect lookups
+
+    Nodes are stored in breadth-first order so every parent precedes its
+    children. Effect annotations attached to any subset of nodes are resolved
+    once into a dense (n_keys, n_nodes) array in which every node carries the
+    effect of its nearest annotated ancestor (itself included). Individuals
+    are then encoded as integer node codes and looked up by indexing.
+    """
+
+    def __init__(self, parents):
+        """Initialize from a {node: parent} mapping with exactly one root (parent None)"""
+
+        roots = [node for node, parent in parents.items() if parent is None]
+        if len(roots) != 1:
+            raise ValueError(f"Haplogroup tree needs exactly one root, found {roots}")
+
+        children = {node: [] for node in parents}
+        for node, parent in parents.items():
+            if parent is not None:
+                if parent not in children:
+                    raise ValueError(f"Parent {parent} of {node} is not in the tree")
+                children[parent].append(node)
+
+        # Breadth-first order: parents always precede their children
+        self.nodes = [roots[0]]
+        for node in self.nodes:
+            self.nodes.extend(children[node])
+
+        if len(self.nodes) != len(parents):
+            raise ValueError("Haplogroup tree contains a cycle or disconnected nodes")
+
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.parent_index = np.array([self.index[parents[node]] if parents[node] is not None else -1
+                                      for node in self.nodes])
+        self.depth = np.zeros(len(self.nodes), dtype=int)
+        for i in range(1, len(self.nodes)):
+            self.depth[i] = self.depth[self.parent_index[i]] + 1
+
+    @classmethod
+    def default(cls):
+        """Skeleton tree of the major haplogroups"""
+
+        return cls(DEFAULT_HAPLOGROUP_PARENTS)
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Build from (haplogroup, parent) pairs; the root's parent is None or empty"""
+
+        parents = {}
+        for child, parent in edges:
+            parents[child] = parent if isinstance(parent, str) and parent != '' else None
+        return cls(parents)
+
+    @classmethod
+    def from_csv(cls, path, child_column='haplogroup', parent_column='parent'):
+        """Build from a table with one row per haplogroup and its parent"""
+
+        table = pd.read_csv(path)
+        return cls.from_edges(zip(table[child_column], table[parent_column]))
+
+    @classmethod
+    def from_nested(cls, nested):
+        """Build from a nested {haplogroup: {sub_haplogroup: {...}}} dict with one top-level key"""
+
+        parents = {}
+        stack = [(node, None, subtree) for node, subtree in nested.items()]
+        while stack:
+            node, parent, subtree = stack.pop()
+            parents[node] = parent
+            for child, child_subtree in (subtree or {}).items():
+                stack.append((child, node, child_subtree))
+        return cls(parents)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def ancestors(self, node):
+        """Path from a node up to the root, the node itself first"""
+
+        path = []
+        i = self.index[node]
+        while i >= 0:
+            path.append(self.nodes[i])
+            i = self.parent_index[i]
+        return path
+
+    def encode(self, haplogroups):
+        """Integer node codes for an array of haplogroup labels (-1 if unknown)"""
+
+        return pd.Categorical(np.asarray(haplogroups, dtype=object), categories=self.nodes).codes.astype(np.int64)
+
+    def resolve(self, annotations, keys, default=0.0):
+        """
+        Dense per-node effect table inherited from the nearest annotated ancestor
+
+        annotations maps each key (e.g. a mutation) to {haplogroup: value}.
+        Returns an array of shape (len(keys), n_nodes); nodes with no
+        annotated ancestor get `default`.
+        """
+
+        table = np.full((len(keys), len(self.nodes)), default, dtype=np.float64)
+        annotated = np.zeros((len(keys), len(self.nodes)), dtype=bool)
+
+        for k, key in enumerate(keys):
+            for node, value in annotations.get(key, {}).items():
+                if node not in self.index:
+                    raise ValueError(f"Annotated haplogroup {node} is not in the tree")
+                table[k, self.index[node]] = value
+                annotated[k, self.index[node]] = True
+
+        # Parents precede children, so one forward pass propagates every effect
+        for i in range(1, len(self.nodes)):
+            parent = self.parent_index[i]
+            inherit = ~annotated[:, i]
+            table[inherit, i] = table[inherit, parent]
+            annotated[inherit, i] = annotated[inherit, parent]
+
+        return table
+
+    def collapse_to(self, labels, other='Other'):
+        """
+        Map every node to its nearest ancestor among `labels`
+
+        Returns an array of node -> label strings (`other` when no ancestor is
+        listed), e.g. to reduce sub-haplogroups to the coarse groups of a model.
+        """
+
+        collapsed = np.full(len(self.nodes), other, dtype=object)
+        listed = np.zeros(len(self.nodes), dtype=bool)
+
+        for label in labels:
+            if label in self.index:
+                collapsed[self.index[label]] = label
+                listed[self.index[label]] = True
+
+        for i in range(1, len(self.nodes)):
+            if not listed[i] and listed[self.parent_index[i]]:
+                collapsed[i] = collapsed[self.parent_index[i]]
+                listed[i] = True
+
+        return collapsed
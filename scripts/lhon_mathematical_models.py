@@ -10,6 +10,10 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
 from scipy.optimize import minimize
+from scipy.integrate import trapezoid
+from lhon_checkpointing import RunCheckpointer, settings_digest
+from lhon_frequency_uncertainty import GnomADFrequencyPosterior
+from lhon_subgroup_aggregation import SubgroupAggregator
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -31,6 +35,20 @@ class LHONPenetranceModels:
             '3460G>A': 1.77     # 1 in 56,426
         }
         
+        # Posterior uncertainty of the carrier frequencies from gnomAD AC/AN
+        self.frequency_posterior = GnomADFrequencyPosterior()
+        
+        # Optional polygenic nuclear modifier score (NuclearPolygenicBackground)
+        self.polygenic_background = None
+        
+        # Optional full haplogroup hierarchy (see set_haplogroup_tree)
+        self.haplogroup_tree = None
+        self.haplogroup_tree_effects = None
+        self.haplogroup_node_probabilities = None
+        
+        # Optional continuous pack-years / drinks-per-week model (CorrelatedExposureModel)
+        self.exposure_model = None
+        
         # Population prevalence (cases per 100,000)
         self.population_prevalence = {
             'Madrid_2024': 0.79,
@@ -60,31 +78,109 @@ class LHONPenetranceModels:
         self.age_params = {
             'peak_onset_age': 25,
             'age_std': 10,
-            'late_onset_proportion': 0.10  # 10% after age 50
+            'late_onset_proportion': 0.10,  # 10% after age 50
+            'late_onset_mean': 60,
+            'late_onset_std': 10,
+            'onset_age_range': (5, 90)
         }
         
-    def liability_threshold_model(self, mutation, sex, haplogroup=None, 
-                                environmental_factors=None, age=25):
-        """
-        Liability threshold model for LHON penetrance
-        P(affected) = Φ((β₀ + β₁X₁ + ... + βₙXₙ - T)/σ)
-        """
-        
         # Base liability scores by mutation (from literature)
-        base_liability = {
+        self.base_liability = {
             '11778G>A': 0.5,   # 3.8% baseline penetrance
             '14484T>C': 0.2,   # 0.8% baseline penetrance
             '3460G>A': 1.8     # 14.1% baseline penetrance
         }
         
-        liability = base_liability.get(mutation, 0.5)
+        # Liability threshold, residual SD and weight of the age term
+        self.liability_params = {
+            'threshold': 2.0,
+            'sigma': 1.0,
+            'age_weight': 0.2
+        }
+        
+        # Carrier demographics used by the population simulations
+        self.carrier_haplogroup_frequencies = {
+            '11778G>A': {'J': 0.15, 'other': 0.85},
+            '14484T>C': {'J': 0.08, 'non_J': 0.92},  # 8% J in gnomAD
+            '3460G>A': {'L2': 1.0}                   # 3460G>A only on L2 in gnomAD
+        }
+        
+        self.exposure_prevalence = {
+            'smoking': 0.6,                 # 60% smoking rate
+            'heavy_smoking_fraction': 0.3,  # of smokers
+            'alcohol': 0.9,                 # 90% drink alcohol
+            'heavy_alcohol_fraction': 0.2   # of drinkers
+        }
+        
+        # Log-scale SDs of the odds ratios, as in bayesian_hierarchical_model
+        self.environmental_or_log_sd = {
+            'male_sex': 0.2,
+            'smoking_heavy': 0.3,
+            'smoking_light': 0.3,
+            'alcohol_heavy': 0.3,
+            'alcohol_light': 0.3
+        }
+        
+        # Priors of bayesian_hierarchical_model, shared with its numerical
+        # version: Beta base penetrance per mutation and lognormal modifiers
+        # as (log mean, log SD); an SD of 0 is a fixed multiplier
+        self.hierarchical_priors = {
+            'base_penetrance': {
+                '11778G>A': (4, 96),    # ~4% mean
+                '14484T>C': (1, 124),   # ~0.8% mean
+                '3460G>A': (14, 86)     # ~14% mean
+            },
+            'modifiers': {
+                'male_sex': (np.log(7.11), 0.2),
+                'smoking_heavy': (np.log(3.16), 0.3),
+                'haplogroup_j_11778': (np.log(1.31), 0.1),
+                'haplogroup_j_14484': (np.log(27.0), 0.5),
+                'haplogroup_non_j_14484': (np.log(0.037), 0.0)  # Very low penetrance on non-J
+            },
+            # (mutation, sex, haplogroup, environment, modifiers applied)
+            'scenarios': [
+                ('11778G>A', 'female', None, {}, []),
+                ('11778G>A', 'male', None, {}, ['male_sex']),
+                ('11778G>A', 'male', 'J', {'smoking_heavy': True},
+                 ['male_sex', 'smoking_heavy', 'haplogroup_j_11778']),
+                ('14484T>C', 'male', 'J', {}, ['male_sex', 'haplogroup_j_14484']),
+                ('14484T>C', 'male', 'non_J', {}, ['male_sex', 'haplogroup_non_j_14484']),
+                ('3460G>A', 'male', None, {}, ['male_sex'])
+            ]
+        }
+        
+        # Integer-coded strata used for per-replicate breakdowns
+        self.strata_levels = {
+            'mutation': ['11778G>A', '14484T>C', '3460G>A'],
+            'sex': ['male', 'female'],
+            'haplogroup': ['J', 'non_J', 'other', 'L2'],
+            'smoking': ['none', 'light', 'heavy'],
+            'alcohol': ['none', 'light', 'heavy']
+        }
+        
+    def liability_threshold_model(self, mutation, sex, haplogroup=None, 
+                                environmental_factors=None, age=25, exposure_liability=None):
+        """
+        Liability threshold model for LHON penetrance
+        P(affected) = Φ((β₀ + β₁X₁ + ... + βₙXₙ - T)/σ)
+        
+        exposure_liability (a dose-response contribution from
+        self.exposure_model) replaces the smoking and alcohol odds ratios of
+        environmental_factors.
+        """
+        
+        liability = self.base_liability.get(mutation, 0.5)
         
         # Sex effect (males have higher liability)
         if sex == 'male':
             liability += np.log(self.environmental_ors['male_sex'])
         
         # Haplogroup effects
-        if haplogroup and mutation in self.haplogroup_ors:
+        if (haplogroup and self.haplogroup_tree is not None and haplogroup in self.haplogroup_tree.index
+                and mutation in self.strata_levels['mutation']):
+            liability += self.haplogroup_tree_effects[self.strata_levels['mutation'].index(mutation),
+                                                      self.haplogroup_tree.index[haplogroup]]
+        elif haplogroup and mutation in self.haplogroup_ors:
             if haplogroup in self.haplogroup_ors[mutation]:
                 or_value = self.haplogroup_ors[mutation][haplogroup]
                 liability += np.log(or_value)
@@ -92,70 +188,306 @@ class LHONPenetranceModels:
         # Environmental factors
         if environmental_factors:
             for factor, present in environmental_factors.items():
+                if exposure_liability is not None and factor.startswith(('smoking', 'alcohol')):
+                    continue
                 if present and factor in self.environmental_ors:
                     liability += np.log(self.environmental_ors[factor])
+        if exposure_liability is not None:
+            liability += exposure_liability
         
         # Age effect (younger onset has slightly higher liability)
         age_factor = np.exp(-(age - self.age_params['peak_onset_age'])**2 / 
                            (2 * self.age_params['age_std']**2))
-        liability += 0.2 * age_factor
+        liability += self.liability_params['age_weight'] * age_factor
         
         # Convert to penetrance using cumulative normal distribution
-        threshold = 2.0  # Liability threshold
-        sigma = 1.0      # Residual variance
+        threshold = self.liability_params['threshold']
+        sigma = self.liability_params['sigma']
         
         penetrance = stats.norm.cdf((liability - threshold) / sigma)
         
         return penetrance, liability
     
-    def bayesian_hierarchical_model(self, n_simulations=10000):
+    def set_haplogroup_tree(self, tree, haplogroup_ors=None, node_frequencies=None):
+        """
+        Resolve haplogroup effects over a full haplogroup hierarchy
+        
+        haplogroup_ors maps mutation -> {haplogroup: OR} at any level of the
+        tree (e.g. J1c, J2b); every other node inherits from its nearest
+        annotated ancestor. Defaults to self.haplogroup_ors with 'non_J'
+        attached to the root, so it applies to every haplogroup outside J.
+        Log odds ratios are stored once as self.haplogroup_tree_effects,
+        shape (n_mutations, n_nodes).
+        
+        node_frequencies maps each coarse haplogroup (strata_levels) to
+        {node: weight}, the distribution of tree nodes that simulated carriers
+        of that group are drawn from (see sample_haplogroup_nodes). By
+        default every coarse group is spread evenly over the leaves of the
+        tree that collapse to it ('non_J' and 'other' over the leaves outside
+        J and L2). Stored as self.haplogroup_node_probabilities, shape
+        (n_haplogroups, n_nodes).
+        """
+        
+        if haplogroup_ors is None:
+            haplogroup_ors = {
+                mutation: {(tree.nodes[0] if hap == 'non_J' else hap): value for hap, value in ors.items()}
+                for mutation, ors in self.haplogroup_ors.items()
+            }
+        
+        log_ors = {mutation: {hap: np.log(value) for hap, value in ors.items()}
+                   for mutation, ors in haplogroup_ors.items()}
+        
+        self.haplogroup_tree = tree
+        self.haplogroup_tree_effects = tree.resolve(log_ors, self.strata_levels['mutation'])
+        
+        if node_frequencies is None:
+            leaves = np.ones(len(tree), dtype=bool)
+            leaves[tree.parent_index[1:]] = False
+            collapsed = tree.collapse_to(['J', 'L2'], other='other')
+            node_frequencies = {
+                hap: {node: 1.0 for node, group, leaf in zip(tree.nodes, collapsed, leaves)
+                      if leaf and group == ('other' if hap == 'non_J' else hap)}
+                for hap in self.strata_levels['haplogroup']
+            }
+        
+        probabilities = np.zeros((len(self.strata_levels['haplogroup']), len(tree)))
+        for j, hap in enumerate(self.strata_levels['haplogroup']):
+            for node, weight in node_frequencies.get(hap, {}).items():
+                probabilities[j, tree.index[node]] = weight
+        totals = probabilities.sum(axis=1, keepdims=True)
+        self.haplogroup_node_probabilities = np.divide(probabilities, totals,
+                                                       out=np.zeros_like(probabilities), where=totals > 0)
+    
+    def sample_haplogroup_nodes(self, haplogroup, rng):
+        """
+        Draw haplogroup tree node codes for carriers of the coarse haplogroup codes
+        
+        Nodes follow self.haplogroup_node_probabilities; carriers of a coarse
+        group with no tree nodes get -1, which liability_threshold_batch
+        treats as the coarse haplogroup effect.
+        """
+        
+        haplogroup = np.asarray(haplogroup)
+        cumulative = np.cumsum(self.haplogroup_node_probabilities, axis=1)
+        uniforms = rng.random(len(haplogroup))
+        nodes = np.full(len(haplogroup), -1, dtype=np.int64)
+        
+        for j in range(cumulative.shape[0]):
+            if cumulative[j, -1] <= 0:
+                continue
+            members = haplogroup == j
+            nodes[members] = np.minimum(np.searchsorted(cumulative[j], uniforms[members], side='right'),
+                                        cumulative.shape[1] - 1)
+        
+        return nodes
+    
+    def liability_effect_tables(self):
+        """
+        Lookup tables of liability contributions indexed by strata codes
+        
+        Returns a dict with 'base' (mutation), 'haplogroup' (mutation x
+        haplogroup), 'smoking' and 'alcohol' (exposure level) arrays and the
+        scalar 'male' effect, all on the scale used by liability_threshold_model.
+        """
+        
+        levels = self.strata_levels
+        
+        base = np.array([self.base_liability[m] for m in levels['mutation']])
+        
+        haplogroup = np.zeros((len(levels['mutation']), len(levels['haplogroup'])))
+        for i, mutation in enumerate(levels['mutation']):
+            for j, hap in enumerate(levels['haplogroup']):
+                or_value = self.haplogroup_ors.get(mutation, {}).get(hap)
+                if or_value is not None:
+                    haplogroup[i, j] = np.log(or_value)
+        
+        smoking = np.array([0.0,
+                            np.log(self.environmental_ors['smoking_light']),
+                            np.log(self.environmental_ors['smoking_heavy'])])
+        alcohol = np.array([0.0,
+                            np.log(self.environmental_ors['alcohol_light']),
+                            np.log(self.environmental_ors['alcohol_heavy'])])
+        
+        return {
+            'base': base,
+            'male': np.log(self.environmental_ors['male_sex']),
+            'haplogroup': haplogroup,
+            'smoking': smoking,
+            'alcohol': alcohol
+        }
+    
+    def liability_threshold_batch(self, mutation, male, haplogroup, smoking, alcohol, age,
+                                  nuclear_score=None, haplogroup_nodes=None, exposure_liability=None):
+        """
+        Vectorized liability threshold model over arrays of carriers
+        
+        All arguments are equal-length arrays of strata codes (see
+        self.strata_levels), a boolean male indicator and ages. Returns
+        (penetrance, liability) arrays matching liability_threshold_model.
+        
+        nuclear_score adds a polygenic nuclear background to liability; the
+        residual SD then shrinks so that the background variance
+        (self.polygenic_background.heritability) is carved out of it and the
+        marginal penetrance is preserved; a heritability of sigma^2 or more
+        raises ValueError.
+        
+        haplogroup_nodes takes node codes of self.haplogroup_tree (see
+        HaplogroupTree.encode and sample_haplogroup_nodes) in place of the
+        coarse haplogroup codes; the effect is a single gather from the
+        pre-resolved per-node table, and carriers with code -1 keep their
+        coarse haplogroup effect.
+        
+        exposure_liability replaces the categorical smoking and alcohol effects
+        with per-carrier dose-response contributions (see
+        CorrelatedExposureModel.sample); the level codes are then ignored.
+        """
+        
+        tables = self.liability_effect_tables()
+        
+        mutation = np.asarray(mutation)
+        liability = tables['base'][mutation]
+        liability = liability + tables['male'] * np.asarray(male, dtype=np.float64)
+        if haplogroup_nodes is not None:
+            haplogroup_nodes = np.asarray(haplogroup_nodes)
+            liability = liability + np.where(haplogroup_nodes >= 0,
+                                             self.haplogroup_tree_effects[mutation, haplogroup_nodes],
+                                             tables['haplogroup'][mutation, np.asarray(haplogroup)])
+        else:
+            liability = liability + tables['haplogroup'][mutation, np.asarray(haplogroup)]
+        if exposure_liability is not None:
+            liability = liability + exposure_liability
+        else:
+            liability = liability + tables['smoking'][np.asarray(smoking)]
+            liability = liability + tables['alcohol'][np.asarray(alcohol)]
+        
+        age_factor = np.exp(-(np.asarray(age, dtype=np.float64) - self.age_params['peak_onset_age'])**2 /
+                           (2 * self.age_params['age_std']**2))
+        liability = liability + self.liability_params['age_weight'] * age_factor
+        
+        sigma = self.liability_params['sigma']
+        if nuclear_score is not None:
+            heritability = self.polygenic_background.heritability
+            if heritability >= sigma**2:
+                raise ValueError(f"Polygenic heritability {heritability} must be below the liability "
+                                 f"variance {sigma**2}")
+            liability = liability + nuclear_score
+            sigma = np.sqrt(sigma**2 - heritability)
+        
+        penetrance = stats.norm.cdf((liability - self.liability_params['threshold']) / sigma)
+        
+        return penetrance, liability
+    
+    def onset_age_cdf(self, ages):
+        """
+        Cumulative distribution of age at onset among carriers who become affected
+        
+        Onset follows a mixture of an early component around peak_onset_age and
+        a late component, both truncated to onset_age_range. The late weight is
+        set so that a fraction late_onset_proportion of onsets occur after 50.
+        """
+        
+        low, high = self.age_params['onset_age_range']
+        
+        def truncated_cdf(x, mean, std):
+            lo, hi = stats.norm.cdf([(low - mean) / std, (high - mean) / std])
+            return np.clip((stats.norm.cdf((x - mean) / std) - lo) / (hi - lo), 0, 1)
+        
+        early = (self.age_params['peak_onset_age'], self.age_params['age_std'])
+        late = (self.age_params['late_onset_mean'], self.age_params['late_onset_std'])
+        
+        early_after_50 = 1 - truncated_cdf(50, *early)
+        late_after_50 = 1 - truncated_cdf(50, *late)
+        late_weight = (self.age_params['late_onset_proportion'] - early_after_50) / (late_after_50 - early_after_50)
+        late_weight = min(max(late_weight, 0.0), 1.0)
+        
+        ages = np.asarray(ages, dtype=np.float64)
+        return (1 - late_weight) * truncated_cdf(ages, *early) + late_weight * truncated_cdf(ages, *late)
+    
+    def residual_risk_batch(self, current_age, mutation, male, haplogroup, smoking, alcohol,
+                            horizon=None):
+        """
+        Remaining LHON risk of carriers who are unaffected at their current age
+        
+        Lifetime penetrance pi comes from liability_threshold_batch (evaluated
+        at the peak onset age) and onset ages follow onset_age_cdf F, so
+        P(onset after a | unaffected at a) = pi (1 - F(a)) / (1 - pi F(a)).
+        With horizon=h the risk of onset within (a, a + h] is returned instead.
+        Arguments are equal-length arrays of strata codes as in
+        liability_threshold_batch; F is tabulated once and interpolated.
+        """
+        
+        current_age = np.asarray(current_age, dtype=np.float64)
+        
+        lifetime, _ = self.liability_threshold_batch(
+            mutation, male, haplogroup, smoking, alcohol,
+            np.full(current_age.shape, self.age_params['peak_onset_age'])
+        )
+        
+        low, high = self.age_params['onset_age_range']
+        grid = np.linspace(low, high, int((high - low) * 40) + 1)
+        cdf_grid = self.onset_age_cdf(grid)
+        onset_cdf = np.interp(current_age, grid, cdf_grid)
+        
+        if horizon is None:
+            remaining = 1 - onset_cdf
+        else:
+            remaining = np.interp(current_age + horizon, grid, cdf_grid) - onset_cdf
+        
+        return lifetime * remaining / (1 - lifetime * onset_cdf)
+    
+    def residual_risk(self, current_age, mutation, sex, haplogroup=None,
+                      environmental_factors=None, horizon=None):
+        """
+        Remaining risk for one unaffected carrier (see residual_risk_batch)
+        
+        Takes the same arguments as liability_threshold_model, e.g.
+        residual_risk(35, '11778G>A', 'male').
+        """
+        
+        lifetime, _ = self.liability_threshold_model(
+            mutation, sex, haplogroup, environmental_factors, self.age_params['peak_onset_age']
+        )
+        
+        onset_cdf = self.onset_age_cdf(current_age)
+        if horizon is None:
+            remaining = 1 - onset_cdf
+        else:
+            remaining = self.onset_age_cdf(current_age + horizon) - onset_cdf
+        
+        return float(lifetime * remaining / (1 - lifetime * onset_cdf))
+    
+    def bayesian_hierarchical_model(self, n_simulations=10000, analytic=False,
+                                    grid_size=4000, n_quadrature=64):
         """
         Bayesian hierarchical model with uncertainty quantification
+        
+        With analytic=True no draws are made: each scenario's penetrance
+        distribution is computed numerically (see
+        hierarchical_scenario_distributions) and (summary, densities) frames
+        are returned instead of a frame of simulated penetrances.
         """
         
+        if analytic:
+            return self.hierarchical_scenario_distributions(grid_size, n_quadrature)
+        
+        priors = self.hierarchical_priors
         results = []
         
         for _ in range(n_simulations):
             # Sample from prior distributions
-            base_penetrance = {
-                '11778G>A': np.random.beta(4, 96),      # ~4% mean
-                '14484T>C': np.random.beta(1, 124),     # ~0.8% mean  
-                '3460G>A': np.random.beta(14, 86)       # ~14% mean
-            }
-            
-            # Sample environmental effects
-            male_or = np.random.lognormal(np.log(7.11), 0.2)
-            smoking_or = np.random.lognormal(np.log(3.16), 0.3)
+            base_penetrance = {mutation: np.random.beta(a, b)
+                               for mutation, (a, b) in priors['base_penetrance'].items()}
             
-            # Sample haplogroup effects
-            hap_j_11778 = np.random.lognormal(np.log(1.31), 0.1)
-            hap_j_14484 = np.random.lognormal(np.log(27.0), 0.5)
+            # Sample environmental and haplogroup effects
+            modifiers = {name: np.random.lognormal(mu, sd) if sd > 0 else np.exp(mu)
+                         for name, (mu, sd) in priors['modifiers'].items()}
             
             # Calculate penetrance for different scenarios
-            scenarios = [
-                ('11778G>A', 'female', None, {}),
-                ('11778G>A', 'male', None, {}),
-                ('11778G>A', 'male', 'J', {'smoking_heavy': True}),
-                ('14484T>C', 'male', 'J', {}),
-                ('14484T>C', 'male', 'non_J', {}),
-                ('3460G>A', 'male', None, {})
-            ]
-            
             sim_results = {}
-            for mutation, sex, hap, env in scenarios:
+            for mutation, sex, hap, env, applied in priors['scenarios']:
                 base = base_penetrance[mutation]
-                
-                # Apply modifiers
-                if sex == 'male':
-                    base *= male_or
-                if env.get('smoking_heavy'):
-                    base *= smoking_or
-                if mutation == '11778G>A' and hap == 'J':
-                    base *= hap_j_11778
-                elif mutation == '14484T>C' and hap == 'J':
-                    base *= hap_j_14484
-                elif mutation == '14484T>C' and hap == 'non_J':
-                    base *= 0.037  # Very low penetrance on non-J
+                for name in applied:
+                    base *= modifiers[name]
                 
                 # Cap at 100%
                 penetrance = min(base, 1.0)
@@ -167,26 +499,157 @@ class LHONPenetranceModels:
         
         return pd.DataFrame(results)
     
-    def monte_carlo_population_model(self, population_size=100000, n_simulations=1000):
+    def hierarchical_scenario_priors(self):
+        """
+        Prior structure of the bayesian_hierarchical_model scenarios
+        
+        Each scenario's uncapped penetrance is Beta(a, b) times a product of
+        independent lognormal modifiers, i.e. log penetrance is log Beta plus
+        Normal(mu, sd^2), both read from self.hierarchical_priors. Returns
+        {scenario name: ((a, b), mu, sd)} with the same names as the sampled
+        model.
+        """
+        
+        hierarchical = self.hierarchical_priors
+        
+        priors = {}
+        for mutation, sex, hap, env, applied in hierarchical['scenarios']:
+            modifiers = [hierarchical['modifiers'][name] for name in applied]
+            mu = sum(m for m, _ in modifiers)
+            sd = np.sqrt(sum(sd**2 for _, sd in modifiers))
+            priors[f"{mutation}_{sex}_{hap}_{list(env.keys())}"] = (hierarchical['base_penetrance'][mutation], mu, sd)
+        
+        return priors
+    
+    def hierarchical_scenario_distributions(self, grid_size=4000, n_quadrature=64,
+                                            quantiles=(0.025, 0.5, 0.975)):
+        """
+        Deterministic penetrance distributions of the hierarchical scenarios
+        
+        For X = B * exp(mu + sd * Z) with B ~ Beta(a, b) and Z standard normal,
+        the log-space convolution is done by Gauss-Hermite quadrature over Z:
+        F(x) = E[F_B(x * exp(-mu - sd * Z))], and likewise for the density.
+        Both are evaluated on a log-spaced grid over (0, 1); the cap at 100%
+        puts the mass 1 - F(1) on penetrance 1.
+        
+        Returns (summary, densities): summary has one row per scenario with
+        the capped mean, requested quantiles and prob_capped; densities is a
+        long frame of (scenario, penetrance, cdf, density) for the continuous
+        part below the cap.
+        """
+        
+        nodes, weights = np.polynomial.hermite_e.hermegauss(n_quadrature)
+        weights = weights / weights.sum()
+        grid = np.logspace(-10, 0, grid_size)
+        
+        summary_rows = []
+        density_frames = []
+        
+        for name, ((a, b), mu, sd) in self.hierarchical_scenario_priors().items():
+            # Beta argument for every grid point and quadrature node
+            shift = np.exp(-mu - sd * nodes)
+            scaled = grid[:, None] * shift[None, :]
+            
+            cdf = stats.beta.cdf(scaled, a, b) @ weights
+            density = (stats.beta.pdf(scaled, a, b) * shift) @ weights
+            prob_capped = 1 - cdf[-1]
+            
+            # E[min(X, 1)] = integral of the survival function over [0, 1]
+            survival = np.concatenate([[1.0], 1 - cdf])
+            mean = trapezoid(survival, np.concatenate([[0.0], grid]))
+            
+            row = {'scenario': name, 'mean': mean, 'prob_capped': prob_capped}
+            for q in quantiles:
+                row[f"q{q:g}"] = 1.0 if q > cdf[-1] else float(np.interp(q, cdf, grid))
+            summary_rows.append(row)
+            
+            density_frames.append(pd.DataFrame({
+                'scenario': name, 'penetrance': grid, 'cdf': cdf, 'density': density
+            }))
+        
+        return (pd.DataFrame(summary_rows).set_index('scenario'),
+                pd.concat(density_frames, ignore_index=True))
+    
+    def monte_carlo_population_model(self, population_size=100000, n_simulations=1000,
+                                     checkpoint_dir=None, checkpoint_every=10, resume=False,
+                                     stratified=False, frequency_uncertainty=False):
         """
         Monte Carlo simulation of LHON in a population
+        
+        With frequency_uncertainty=True each replicate draws its carrier
+        frequencies from the gnomAD posteriors instead of using the point
+        estimates.
+        
+        Returns (results, last population). With stratified=True it returns
+        (results, strata, last population) instead, where strata holds
+        carrier and affected counts per replicate for every level of the
+        mutation, sex, haplogroup, smoking and alcohol strata (see
+        stratified_counts).
+        
+        If checkpoint_dir is given, every block of checkpoint_every completed
+        replicates is written to disk together with the RNG state. With
+        resume=True an interrupted run continues from its last checkpoint and
+        returns the same results as an uninterrupted run. The checkpoint
+        records the run arguments and digests of the optional haplogroup
+        tree, exposure model and polygenic background, so resuming under a
+        different model configuration raises ValueError.
         """
         
         results = []
+        strata_rows = []
+        df = pd.DataFrame()
+        start_sim = 0
+        checkpointer = None
         
-        for sim in range(n_simulations):
+        if checkpoint_dir is not None:
+            checkpointer = RunCheckpointer(
+                checkpoint_dir, 'monte_carlo_population_model',
+                config={
+                    'population_size': population_size,
+                    'n_simulations': n_simulations,
+                    'checkpoint_every': checkpoint_every,
+                    'carrier_frequencies': dict(self.carrier_frequencies),
+                    'frequency_uncertainty': frequency_uncertainty,
+                    'stratified': stratified,
+                    # Optional model components, as digests of their settings
+                    'haplogroup_tree': None if self.haplogroup_tree is None else settings_digest(
+                        self.haplogroup_tree, self.haplogroup_tree_effects, self.haplogroup_node_probabilities),
+                    'exposure_model': settings_digest(self.exposure_model),
+                    'polygenic_background': settings_digest(self.polygenic_background)
+                }
+            )
+            checkpoint = checkpointer.load() if resume else None
+            
+            if checkpoint is not None:
+                for record in checkpoint['records']:
+                    results.append(record['summary'])
+                    strata_rows.extend(record['strata'])
+                start_sim = checkpoint['next_index']
+                df = checkpoint['aggregator']['last_population']
+                print(f"Resuming Monte Carlo run at simulation {start_sim} of {n_simulations}")
+            else:
+                checkpointer.clear()
+        
+        block_results = []
+        
+        for sim in range(start_sim, n_simulations):
             # Generate population
             population = []
+            strata_codes = []
+            
+            carrier_frequencies = self.carrier_frequencies
+            if frequency_uncertainty:
+                carrier_frequencies = self.frequency_posterior.sample_dicts(1, np.random)[0]
             
             for i in range(population_size):
                 # Assign mutation (based on gnomAD frequencies)
                 rand = np.random.random() * 100000
                 
-                if rand < self.carrier_frequencies['3460G>A']:
+                if rand < carrier_frequencies['3460G>A']:
                     mutation = '3460G>A'
-                elif rand < self.carrier_frequencies['3460G>A'] + self.carrier_frequencies['11778G>A']:
+                elif rand < carrier_frequencies['3460G>A'] + carrier_frequencies['11778G>A']:
                     mutation = '11778G>A'
-                elif rand < sum(self.carrier_frequencies.values()):
+                elif rand < sum(carrier_frequencies.values()):
                     mutation = '14484T>C'
                 else:
                     mutation = None  # No LHON mutation
@@ -198,18 +661,38 @@ class LHONPenetranceModels:
                     age = max(15, min(80, age))  # Constrain age range
                     
                     # Assign haplogroup (simplified)
+                    hap_freqs = self.carrier_haplogroup_frequencies[mutation]
                     if mutation == '14484T>C':
-                        haplogroup = 'J' if np.random.random() < 0.08 else 'non_J'  # 8% J in gnomAD
+                        haplogroup = 'J' if np.random.random() < hap_freqs['J'] else 'non_J'
                     elif mutation == '11778G>A':
-                        haplogroup = 'J' if np.random.random() < 0.15 else 'other'
+                        haplogroup = 'J' if np.random.random() < hap_freqs['J'] else 'other'
                     else:
-                        haplogroup = 'L2'  # 3460G>A only on L2 in gnomAD
+                        haplogroup = 'L2'
+                    
+                    # Refine to a haplogroup tree node when a tree is set
+                    haplogroup_label = haplogroup
+                    if self.haplogroup_tree is not None:
+                        node = self.sample_haplogroup_nodes(
+                            [self.strata_levels['haplogroup'].index(haplogroup)], np.random
+                        )[0]
+                        if node >= 0:
+                            haplogroup_label = self.haplogroup_tree.nodes[node]
                     
                     # Assign environmental factors
-                    smoking = np.random.random() < 0.6  # 60% smoking rate
-                    heavy_smoking = smoking and np.random.random() < 0.3
-                    alcohol = np.random.random() < 0.9   # 90% drink alcohol
-                    heavy_alcohol = alcohol and np.random.random() < 0.2
+                    exposure_liability = None
+                    if self.exposure_model is not None:
+                        exposures = self.exposure_model.sample(1, np.random)
+                        smoking = bool(exposures['smoking'][0] > 0)
+                        heavy_smoking = bool(exposures['smoking'][0] == 2)
+                        alcohol = bool(exposures['alcohol'][0] > 0)
+                        heavy_alcohol = bool(exposures['alcohol'][0] == 2)
+                        exposure_liability = exposures['liability'][0]
+                    else:
+                        exposure = self.exposure_prevalence
+                        smoking = np.random.random() < exposure['smoking']
+                        heavy_smoking = smoking and np.random.random() < exposure['heavy_smoking_fraction']
+                        alcohol = np.random.random() < exposure['alcohol']
+                        heavy_alcohol = alcohol and np.random.random() < exposure['heavy_alcohol_fraction']
                     
                     env_factors = {
                         'smoking_heavy': heavy_smoking,
@@ -220,18 +703,27 @@ class LHONPenetranceModels:
                     
                     # Calculate penetrance
                     penetrance, liability = self.liability_threshold_model(
-                        mutation, sex, haplogroup, env_factors, age
+                        mutation, sex, haplogroup_label, env_factors, age, exposure_liability
                     )
                     
                     # Determine if affected
                     affected = np.random.random() < penetrance
                     
+                    strata_codes.append((
+                        self.strata_levels['mutation'].index(mutation),
+                        0 if sex == 'male' else 1,
+                        self.strata_levels['haplogroup'].index(haplogroup),
+                        2 if heavy_smoking else int(smoking),
+                        2 if heavy_alcohol else int(alcohol)
+                    ))
+                    
                     population.append({
                         'id': i,
                         'mutation': mutation,
                         'sex': sex,
                         'age': age,
                         'haplogroup': haplogroup,
+                        'haplogroup_node': haplogroup_label,
                         'smoking_heavy': heavy_smoking,
                         'alcohol_heavy': heavy_alcohol,
                         'penetrance': penetrance,
@@ -246,15 +738,10 @@ class LHONPenetranceModels:
                 total_carriers = len(df)
                 total_affected = df['affected'].sum()
                 
-                # By mutation
-                mutation_stats = df.groupby('mutation').agg({
-                    'affected': ['count', 'sum', 'mean']
-                }).round(4)
-                
-                # By sex
-                sex_stats = df.groupby('sex').agg({
-                    'affected': ['count', 'sum', 'mean']
-                }).round(4)
+                # By mutation, sex, haplogroup and exposure
+                sim_strata = self.stratified_counts(
+                    np.array(strata_codes), df['affected'].to_numpy(), sim
+                )
                 
                 # Overall penetrance
                 overall_penetrance = total_affected / total_carriers if total_carriers > 0 else 0
@@ -262,16 +749,626 @@ class LHONPenetranceModels:
                 # Population prevalence (per 100,000)
                 pop_prevalence = (total_affected / population_size) * 100000
                 
-                results.append({
+                sim_result = {
                     'simulation': sim,
                     'total_carriers': total_carriers,
                     'total_affected': total_affected,
                     'overall_penetrance': overall_penetrance,
                     'population_prevalence': pop_prevalence,
                     'carrier_frequency': (total_carriers / population_size) * 100000
-                })
+                }
+                results.append(sim_result)
+                strata_rows.extend(sim_strata)
+                block_results.append({'summary': sim_result, 'strata': sim_strata})
+            
+            # Checkpoint each completed block of replicates
+            if checkpointer is not None and ((sim + 1) % checkpoint_every == 0 or sim + 1 == n_simulations):
+                checkpointer.save(sim + 1, block_results, aggregator={'last_population': df})
+                block_results = []
+        
+        population = df if len(results) > 0 else None
+        
+        if stratified:
+            strata_df = pd.DataFrame(strata_rows, columns=[
+                'simulation', 'stratum', 'level', 'carriers', 'affected', 'penetrance'
+            ])
+            return pd.DataFrame(results), strata_df, population
+        
+        return pd.DataFrame(results), population
+    
+    def stratified_counts(self, strata_codes, affected, simulation=0):
+        """
+        Carrier and affected counts for every stratum level of one replicate
         
-        return pd.DataFrame(results), df if len(results) > 0 else None
+        strata_codes is an (n_carriers, n_strata) integer array with one column
+        per entry of self.strata_levels, in the same order. Each stratum is
+        one SubgroupAggregator grouping, counted in a single pass; the result
+        is a list of tidy rows (simulation, stratum, level, carriers,
+        affected, penetrance).
+        """
+        
+        levels = dict(self.strata_levels)
+        levels['affected'] = ['unaffected', 'affected']
+        
+        aggregator = SubgroupAggregator(levels)
+        for stratum in self.strata_levels:
+            aggregator.add_grouping(stratum, [stratum], 'affected', ['affected'])
+        
+        columns = {stratum: strata_codes[:, k] for k, stratum in enumerate(self.strata_levels)}
+        columns['affected'] = np.asarray(affected).astype(np.int64)
+        
+        rows = []
+        for grouping, carriers, affected_counts, _ in aggregator.count(columns):
+            for code, level in enumerate(levels[grouping['name']]):
+                rows.append((
+                    simulation, grouping['name'], level, int(carriers[code]), int(affected_counts[code]),
+                    affected_counts[code] / carriers[code] if carriers[code] > 0 else np.nan
+                ))
+        
+        return rows
+    
+    def carrier_cell_probabilities(self, carrier_frequencies, exposures=False):
+        """
+        Population probabilities of the carrier cells mutation x sex x haplogroup
+        
+        carrier_frequencies is an (n_populations, n_mutations) array per
+        100,000 with columns in strata_levels order. Returns an array of
+        shape (n_populations, n_mutations, 2, n_haplogroups); sex is equally
+        likely and haplogroups follow carrier_haplogroup_frequencies. With
+        exposures=True the cells are further split by the joint smoking and
+        alcohol level distribution (see exposure_level_table), adding two axes.
+        """
+        
+        levels = self.strata_levels
+        hap_probs = np.zeros((len(levels['mutation']), len(levels['haplogroup'])))
+        for i, m in enumerate(levels['mutation']):
+            for hap, freq in self.carrier_haplogroup_frequencies[m].items():
+                hap_probs[i, levels['haplogroup'].index(hap)] = freq
+        
+        carrier_probs = np.asarray(carrier_frequencies, dtype=np.float64) / 100000
+        cells = carrier_probs[:, :, None, None] * np.array([0.5, 0.5])[:, None] * hap_probs[:, None, :]
+        
+        if exposures:
+            level_probabilities, _ = self.exposure_level_table()
+            cells = cells[..., None, None] * level_probabilities
+        
+        return cells
+    
+    def draw_cell_counts(self, population_size, rng, n_populations=1, frequency_uncertainty=False,
+                         exposures=False):
+        """
+        Multinomial carrier counts per cell (see carrier_cell_probabilities)
+        
+        With frequency_uncertainty=True every population draws its own
+        carrier frequencies from the gnomAD posteriors. Returns an integer
+        array of shape (n_populations, n_mutations, 2, n_haplogroups), plus
+        smoking and alcohol axes with exposures=True.
+        """
+        
+        levels = self.strata_levels
+        
+        if frequency_uncertainty:
+            frequencies = self.frequency_posterior.sample(n_populations, rng, levels['mutation'])
+        else:
+            frequencies = np.tile([self.carrier_frequencies[m] for m in levels['mutation']],
+                                  (n_populations, 1))
+        
+        cell_probs = self.carrier_cell_probabilities(frequencies, exposures)
+        flat = cell_probs.reshape(n_populations, -1)
+        pvals = np.column_stack([flat, 1 - flat.sum(axis=1)])
+        counts = rng.multinomial(population_size, pvals)[:, :-1]
+        
+        return counts.reshape(cell_probs.shape)
+    
+    def simulate_carriers(self, cell_counts, rng, affected_uniforms=None):
+        """
+        Per-carrier simulation for given cell counts
+        
+        Expands the counts of draw_cell_counts into one row per carrier,
+        grouped by population and then cell, and draws age, exposures and (if
+        configured) a nuclear modifier score and a haplogroup tree node for
+        each. Cells that include exposure levels fix the carriers' smoking and
+        alcohol levels; with self.exposure_model set, doses are then drawn
+        conditional on those levels. Carriers are affected when their uniform
+        (drawn here unless affected_uniforms is given) falls below their
+        penetrance. Returns the dict described in sample_carrier_population.
+        """
+        
+        cell_counts = np.asarray(cell_counts)
+        n_populations = cell_counts.shape[0]
+        
+        # One row per carrier, grouped by population then cell
+        codes = np.unravel_index(np.repeat(np.arange(cell_counts.size), cell_counts.ravel()), cell_counts.shape)
+        population, mutation, sex, haplogroup = codes[:4]
+        male = sex == 0
+        n = len(mutation)
+        
+        age = np.clip(rng.normal(self.age_params['peak_onset_age'], self.age_params['age_std'], n), 15, 80)
+        
+        pack_years = drinks_per_week = exposure_liability = None
+        if self.exposure_model is not None:
+            if len(codes) == 6:
+                exposures = self.exposure_model.sample_given_levels(codes[4], codes[5], rng)
+            else:
+                exposures = self.exposure_model.sample(n, rng)
+            smoking, alcohol = exposures['smoking'], exposures['alcohol']
+            pack_years, drinks_per_week = exposures['pack_years'], exposures['drinks_per_week']
+            exposure_liability = exposures['liability']
+        elif len(codes) == 6:
+            smoking, alcohol = codes[4], codes[5]
+        else:
+            exposure = self.exposure_prevalence
+            smoking = np.where(rng.random(n) < exposure['smoking'],
+                               np.where(rng.random(n) < exposure['heavy_smoking_fraction'], 2, 1), 0)
+            alcohol = np.where(rng.random(n) < exposure['alcohol'],
+                               np.where(rng.random(n) < exposure['heavy_alcohol_fraction'], 2, 1), 0)
+        
+        nuclear_score = None
+        if self.polygenic_background is not None:
+            nuclear_score = self.polygenic_background.sample_scores(n, rng)
+        
+        haplogroup_node = None
+        if self.haplogroup_tree is not None:
+            haplogroup_node = self.sample_haplogroup_nodes(haplogroup, rng)
+        
+        penetrance, liability = self.liability_threshold_batch(
+            mutation, male, haplogroup, smoking, alcohol, age, nuclear_score,
+            haplogroup_nodes=haplogroup_node, exposure_liability=exposure_liability
+        )
+        if affected_uniforms is None:
+            affected_uniforms = rng.random(n)
+        affected = affected_uniforms < penetrance
+        
+        return {
+            'population': population,
+            'mutation': mutation,
+            'male': male,
+            'age': age,
+            'haplogroup': haplogroup,
+            'haplogroup_node': haplogroup_node,
+            'smoking': smoking,
+            'alcohol': alcohol,
+            'pack_years': pack_years,
+            'drinks_per_week': drinks_per_week,
+            'penetrance': penetrance,
+            'liability': liability,
+            'nuclear_score': nuclear_score,
+            'affected': affected,
+            'carriers': cell_counts.reshape(n_populations, -1).sum(axis=1),
+            'affected_counts': np.bincount(population, weights=affected, minlength=n_populations)
+        }
+    
+    def sample_carrier_population(self, population_size, rng, n_populations=1,
+                                  frequency_uncertainty=False):
+        """
+        Vectorized draw of the carriers in one or more simulated populations
+        
+        Uses the same generative model as monte_carlo_population_model:
+        carrier counts are multinomial over the gnomAD frequencies and every
+        carrier gets sex, age, haplogroup, exposures and an affected status.
+        With frequency_uncertainty=True every population draws its own
+        carrier frequencies from the gnomAD posteriors. If
+        self.polygenic_background is set, each carrier also gets a nuclear
+        modifier score streamed from sampled genotypes. If self.haplogroup_tree
+        is set, each carrier also gets a tree node ('haplogroup_node', see
+        sample_haplogroup_nodes) whose resolved effect replaces the coarse
+        haplogroup effect. If self.exposure_model
+        is set, exposures are continuous pack-years and drinks per week drawn
+        jointly from it and enter liability through its dose-response curves;
+        'smoking' and 'alcohol' then hold the levels derived from the doses.
+        Returns a dict of equal-length arrays ('population' holds the index of
+        the population each carrier belongs to) plus per-population
+        'carriers' and 'affected_counts' totals.
+        """
+        
+        cell_counts = self.draw_cell_counts(population_size, rng, n_populations, frequency_uncertainty)
+        return self.simulate_carriers(cell_counts, rng)
+    
+    def penetrance_subgroup_table(self, carriers, method='wilson', ci=0.95):
+        """
+        Tidy penetrance table with confidence intervals for simulated carriers
+        
+        carriers is the dict returned by sample_carrier_population. Subgroups
+        are mutation, mutation x sex, mutation x haplogroup, smoking and
+        alcohol levels, each counted in one pass (see SubgroupAggregator).
+        """
+        
+        levels = dict(self.strata_levels)
+        levels['affected'] = ['unaffected', 'affected']
+        
+        columns = {
+            'mutation': carriers['mutation'],
+            'sex': (~np.asarray(carriers['male'])).astype(np.int64),  # 'male' is level 0
+            'haplogroup': carriers['haplogroup'],
+            'smoking': carriers['smoking'],
+            'alcohol': carriers['alcohol'],
+            'affected': np.asarray(carriers['affected']).astype(np.int64)
+        }
+        
+        aggregator = (SubgroupAggregator(levels)
+                      .add_grouping('mutation', ['mutation'], 'affected', ['affected'])
+                      .add_grouping('mutation_sex', ['mutation', 'sex'], 'affected', ['affected'])
+                      .add_grouping('mutation_haplogroup', ['mutation', 'haplogroup'], 'affected', ['affected'])
+                      .add_grouping('smoking', ['smoking'], 'affected', ['affected'])
+                      .add_grouping('alcohol', ['alcohol'], 'affected', ['affected']))
+        
+        return aggregator.aggregate(columns, method=method, ci=ci)
+    
+    def _population_quantity(self, carriers, affected, population_size, quantity):
+        """Per-population summary used as the Monte Carlo output"""
+        
+        if quantity == 'overall_penetrance':
+            return affected / np.maximum(carriers, 1)
+        elif quantity == 'population_prevalence':
+            return affected / population_size * 100000
+        else:
+            raise ValueError(f"Unknown quantity: {quantity}")
+    
+    def _mlmc_coarse_expectation(self, quantity, population_size, cell_penetrance):
+        """
+        Exact expectation of the stratum-expectation model's output
+        
+        Given the carriers, affected counts per cell have mean count *
+        cell penetrance, so the expected prevalence is a weighted sum over
+        cells and the expected overall penetrance is the carrier-weighted
+        cell penetrance times P(at least one carrier).
+        """
+        
+        frequencies = np.array([[self.carrier_frequencies[m] for m in self.strata_levels['mutation']]])
+        cell_probs = self.carrier_cell_probabilities(frequencies, exposures=True)[0]
+        carrier_prob = cell_probs.sum()
+        
+        if quantity == 'overall_penetrance':
+            return (np.sum(cell_probs * cell_penetrance) / carrier_prob *
+                    -np.expm1(population_size * np.log1p(-carrier_prob)))
+        elif quantity == 'population_prevalence':
+            return np.sum(cell_probs * cell_penetrance) * 100000
+        else:
+            raise ValueError(f"Unknown quantity: {quantity}")
+    
+    def _mlmc_correction_samples(self, n_samples, rng, quantity, population_size, cell_penetrance):
+        """
+        Coupled per-carrier minus stratum-expectation samples
+        
+        Each replicate draws carrier counts per mutation x sex x haplogroup x
+        exposure cell and, for the coarse model, Binomial(count, cell
+        penetrance) affected carriers per cell. The same carriers are then
+        simulated individually (simulate_carriers); in every cell exactly as
+        many of them as the coarse model made affected get uniforms below
+        the cell penetrance, the rest above it, so both models share all
+        random numbers. Returns (corrections, per-carrier values, carriers
+        simulated per replicate).
+        """
+        
+        expected_carriers = population_size * sum(self.carrier_frequencies.values()) / 100000
+        chunk = max(1, int(1e6 / max(expected_carriers, 1)))
+        
+        corrections = []
+        fine_values = []
+        costs = []
+        
+        for start in range(0, n_samples, chunk):
+            n_chunk = min(chunk, n_samples - start)
+            counts = self.draw_cell_counts(population_size, rng, n_chunk, exposures=True)
+            coarse_affected = rng.binomial(counts, cell_penetrance)
+            
+            carriers = counts.reshape(n_chunk, -1).sum(axis=1)
+            coarse = self._population_quantity(carriers, coarse_affected.reshape(n_chunk, -1).sum(axis=1),
+                                               population_size, quantity)
+            
+            # Rank of every carrier within its cell; the first coarse_affected
+            # of each cell draw below the cell penetrance, the rest above it
+            flat_counts = counts.ravel()
+            cell = np.repeat(np.arange(flat_counts.size), flat_counts)
+            rank = np.arange(len(cell)) - np.repeat(np.cumsum(flat_counts) - flat_counts, flat_counts)
+            threshold = np.broadcast_to(cell_penetrance, counts.shape).ravel()[cell]
+            below = rank < coarse_affected.ravel()[cell]
+            v = rng.random(len(cell))
+            uniforms = np.where(below, threshold * v, threshold + (1 - threshold) * v)
+            
+            draw = self.simulate_carriers(counts, rng, affected_uniforms=uniforms)
+            fine = self._population_quantity(carriers, draw['affected_counts'], population_size, quantity)
+            
+            corrections.append(fine - coarse)
+            fine_values.append(fine)
+            costs.append(carriers.astype(np.float64))
+        
+        return np.concatenate(corrections), np.concatenate(fine_values), np.concatenate(costs)
+    
+    def multilevel_monte_carlo(self, target_rmse, quantity='overall_penetrance',
+                               population_size=100000, n_initial=200, seed=None):
+        """
+        Two-level Monte Carlo estimate of a population-level quantity
+        
+        Level 0 is the stratum-expectation model (expected penetrance per
+        mutation x sex x haplogroup x exposure cell, integrated over age,
+        with binomial affected counts per cell); its expectation is exact
+        (see _mlmc_coarse_expectation), so it has zero variance and needs no
+        replicates. Level 1 is the coupled correction from the full
+        per-carrier simulation (see _mlmc_correction_samples), sampled until
+        its standard error reaches target_rmse. The estimator is unbiased for
+        the per-carrier model. Cost is counted in carriers simulated and
+        compared with plain Monte Carlo on the per-carrier model.
+        """
+        
+        rng = np.random.default_rng(seed)
+        cell_penetrance = self.cell_penetrance()
+        coarse_mean = self._mlmc_coarse_expectation(quantity, population_size, cell_penetrance)
+        
+        n_done = 0
+        sum_y = sum_y2 = sum_q = sum_q2 = sum_cost = 0.0
+        n_extra = n_initial
+        
+        while n_extra > 0:
+            y, q, c = self._mlmc_correction_samples(n_extra, rng, quantity, population_size, cell_penetrance)
+            n_done += n_extra
+            sum_y += y.sum()
+            sum_y2 += (y**2).sum()
+            sum_q += q.sum()
+            sum_q2 += (q**2).sum()
+            sum_cost += c.sum()
+            
+            mean_y = sum_y / n_done
+            var_y = max(sum_y2 / n_done - mean_y**2, 0.0)
+            n_extra = max(0, int(np.ceil(var_y / target_rmse**2)) - n_done)
+        
+        cost = sum_cost / n_done
+        levels_df = pd.DataFrame({
+            'level': [0, 1],
+            'model': ['stratum_expectation', 'per_carrier_correction'],
+            'n_replicates': [0, n_done],
+            'mean_correction': [coarse_mean, mean_y],
+            'variance_correction': [0.0, var_y],
+            'cost_per_replicate': [0.0, cost]
+        })
+        
+        mlmc_cost = n_done * cost
+        
+        # Plain Monte Carlo on the per-carrier model needs V[Q] / eps^2 replicates
+        mean_q = sum_q / n_done
+        var_q = max(sum_q2 / n_done - mean_q**2, 0.0)
+        single_level_cost = max(np.ceil(var_q / target_rmse**2), 1) * cost
+        
+        return {
+            'estimate': coarse_mean + mean_y,
+            'quantity': quantity,
+            'target_rmse': target_rmse,
+            'levels': levels_df,
+            'mlmc_cost': mlmc_cost,
+            'single_level_cost': single_level_cost,
+            'cost_saving': single_level_cost / mlmc_cost if mlmc_cost > 0 else np.nan
+        }
+    
+    def stratum_penetrance_tensor(self, n_draws=0, rng=None, n_age_nodes=32, by_cell=False):
+        """
+        Expected carrier penetrance by mutation x smoking level x alcohol level
+        
+        Penetrance from liability_threshold_batch is averaged over sex,
+        carrier haplogroup frequencies and the clipped Normal age distribution
+        (Gauss-Hermite nodes), and within each exposure level over the
+        liability nodes of exposure_level_table (the level's dose-response
+        distribution when self.exposure_model is set). With n_draws > 0 the
+        sex and exposure odds ratios are drawn from their lognormal
+        uncertainty, shifting every node of a level by the drawn deviation of
+        its log odds ratio, and a leading draw axis is returned, shape
+        (n_draws, 3, 3, 3); otherwise shape (1, 3, 3, 3).
+        With by_cell=True only age is integrated out, giving shape
+        (n_draws, 3, 2, 4, 3, 3) over mutation, sex, haplogroup, smoking and
+        alcohol.
+        """
+        
+        levels = self.strata_levels
+        tables = self.liability_effect_tables()
+        n_draws_eff = max(n_draws, 1)
+        
+        male = np.full(n_draws_eff, tables['male'])
+        smoking = np.tile(tables['smoking'], (n_draws_eff, 1))
+        alcohol = np.tile(tables['alcohol'], (n_draws_eff, 1))
+        
+        if n_draws > 0:
+            sd = self.environmental_or_log_sd
+            male = rng.normal(male, sd['male_sex'])
+            smoking[:, 1] = rng.normal(smoking[:, 1], sd['smoking_light'])
+            smoking[:, 2] = rng.normal(smoking[:, 2], sd['smoking_heavy'])
+            alcohol[:, 1] = rng.normal(alcohol[:, 1], sd['alcohol_light'])
+            alcohol[:, 2] = rng.normal(alcohol[:, 2], sd['alcohol_heavy'])
+        
+        # Integration weights over sex, haplogroup and age
+        sex_weights = np.array([0.5, 0.5])
+        hap_weights = np.zeros((len(levels['mutation']), len(levels['haplogroup'])))
+        for i, m in enumerate(levels['mutation']):
+            for hap, freq in self.carrier_haplogroup_frequencies[m].items():
+                hap_weights[i, levels['haplogroup'].index(hap)] = freq
+        
+        nodes, weights = np.polynomial.hermite.hermgauss(n_age_nodes)
+        ages = np.clip(self.age_params['peak_onset_age'] + np.sqrt(2) * self.age_params['age_std'] * nodes, 15, 80)
+        age_weights = weights / np.sqrt(np.pi)
+        age_term = self.liability_params['age_weight'] * np.exp(
+            -(ages - self.age_params['peak_onset_age'])**2 / (2 * self.age_params['age_std']**2))
+        
+        # Exposure liability per draw, smoking level, alcohol level and node
+        _, exposure_nodes = self.exposure_level_table()
+        exposure = (exposure_nodes[None]
+                    + (smoking - tables['smoking'])[:, :, None, None]
+                    + (alcohol - tables['alcohol'])[:, None, :, None])
+        node_weights = np.full(exposure.shape[-1], 1 / exposure.shape[-1])
+        
+        # Axes: draw, mutation, sex, haplogroup, smoking, alcohol, node, age;
+        # blocks of draws keep the intermediate array bounded
+        block = max(1, 2**22 // (24 * 9 * exposure.shape[-1] * n_age_nodes))
+        blocks = []
+        for start in range(0, n_draws_eff, block):
+            stop = min(start + block, n_draws_eff)
+            liability = (tables['base'][None, :, None, None, None, None, None, None]
+                         + (male[start:stop, None] * np.array([1.0, 0.0]))[:, None, :, None, None, None, None, None]
+                         + tables['haplogroup'][None, :, None, :, None, None, None, None]
+                         + exposure[start:stop, None, None, None, :, :, :, None]
+                         + age_term)
+            penetrance = stats.norm.cdf((liability - self.liability_params['threshold']) /
+                                        self.liability_params['sigma'])
+            
+            if by_cell:
+                blocks.append(np.einsum('kmxhsaqj,q,j->kmxhsa', penetrance, node_weights, age_weights))
+            else:
+                blocks.append(np.einsum('kmxhsaqj,x,mh,q,j->kmsa', penetrance, sex_weights, hap_weights,
+                                        node_weights, age_weights))
+        
+        return np.concatenate(blocks)
+    
+    def cell_penetrance(self, n_age_nodes=32):
+        """Expected penetrance per mutation x sex x haplogroup x smoking x alcohol cell, integrated over age"""
+        
+        return self.stratum_penetrance_tensor(n_age_nodes=n_age_nodes, by_cell=True)[0]
+    
+    def exposure_level_table(self):
+        """
+        Joint smoking x alcohol level distribution and within-level liability
+        
+        Returns (probabilities, nodes): the (3, 3) joint distribution of the
+        none/light/heavy levels and an (3, 3, n_nodes) array of equally
+        weighted liability contributions within each cell. With
+        self.exposure_model set both come from its correlated doses (see
+        CorrelatedExposureModel.level_table); otherwise levels are independent
+        with the exposure_prevalence marginals and each cell has the single
+        node of its categorical odds ratios.
+        """
+        
+        if self.exposure_model is not None:
+            return self.exposure_model.level_table()
+        
+        tables = self.liability_effect_tables()
+        smoking, alcohol = self.exposure_distributions()
+        
+        return (np.outer(smoking[0], alcohol[0]),
+                (tables['smoking'][:, None] + tables['alcohol'][None, :])[:, :, None])
+    
+    @staticmethod
+    def _level_transitions(source, target):
+        """
+        Rank-preserving transition matrices between level distributions
+        
+        source is a (3,) none/light/heavy distribution, target an (n, 3)
+        array. Returns (n, 3, 3) matrices T with T[n, i, j] the fraction of
+        level i moved to level j when individuals keep their exposure rank,
+        so source @ T[n] == target[n].
+        """
+        
+        upper = np.cumsum(source)
+        lower = upper - source
+        target_upper = np.cumsum(target, axis=1)
+        target_lower = target_upper - target
+        
+        overlap = np.clip(np.minimum(upper[None, :, None], target_upper[:, None, :]) -
+                          np.maximum(lower[None, :, None], target_lower[:, None, :]), 0, None)
+        
+        return np.where(source[None, :, None] > 0,
+                        overlap / np.where(source > 0, source, 1)[None, :, None],
+                        np.eye(len(source))[None])
+    
+    def exposure_distributions(self, scenarios=None, baseline_prevalence=None):
+        """
+        Exposure level distributions for a table of exposure scenarios
+        
+        scenarios is a DataFrame whose columns are keys of
+        self.exposure_prevalence; missing columns and NaN entries keep the
+        baseline value (baseline_prevalence, a dict with the same keys,
+        overrides self.exposure_prevalence). Returns (smoking, alcohol) arrays of shape
+        (n_scenarios, 3) over the none/light/heavy levels.
+        """
+        
+        if scenarios is None:
+            scenarios = pd.DataFrame(index=['baseline'])
+        
+        values = {}
+        for key, baseline in {**self.exposure_prevalence, **(baseline_prevalence or {})}.items():
+            if key in scenarios.columns:
+                values[key] = scenarios[key].fillna(baseline).to_numpy(dtype=np.float64)
+            else:
+                values[key] = np.full(len(scenarios), baseline)
+        
+        smoking = np.column_stack([
+            1 - values['smoking'],
+            values['smoking'] * (1 - values['heavy_smoking_fraction']),
+            values['smoking'] * values['heavy_smoking_fraction']
+        ])
+        alcohol = np.column_stack([
+            1 - values['alcohol'],
+            values['alcohol'] * (1 - values['heavy_alcohol_fraction']),
+            values['alcohol'] * values['heavy_alcohol_fraction']
+        ])
+        
+        return smoking, alcohol
+    
+    def exposure_intervention_scenarios(self):
+        """Standard single-factor and combined exposure interventions"""
+        
+        return pd.DataFrame([
+            {'scenario': 'no_smoking', 'smoking': 0.0},
+            {'scenario': 'no_heavy_smoking', 'heavy_smoking_fraction': 0.0},
+            {'scenario': 'no_alcohol', 'alcohol': 0.0},
+            {'scenario': 'no_heavy_alcohol', 'heavy_alcohol_fraction': 0.0},
+            {'scenario': 'no_heavy_smoking_or_heavy_alcohol',
+             'heavy_smoking_fraction': 0.0, 'heavy_alcohol_fraction': 0.0},
+            {'scenario': 'no_smoking_or_alcohol', 'smoking': 0.0, 'alcohol': 0.0}
+        ]).set_index('scenario')
+    
+    def population_attributable_fractions(self, scenarios=None, n_draws=1000, seed=None,
+                                          frequency_uncertainty=True):
+        """
+        Population-attributable fractions for counterfactual exposure scenarios
+        
+        Expected affected carriers per 100,000 are recomputed for every row of
+        scenarios (see exposure_distributions; defaults to
+        exposure_intervention_scenarios) against the baseline exposure
+        distribution (exposure_level_table, correlated when
+        self.exposure_model is set). Scenario marginals are reached by moving
+        carriers between levels in rank order (see _level_transitions), so
+        the other exposure is unchanged. Stratum penetrances are computed once
+        per odds-ratio draw, so the whole scenario grid is evaluated in a
+        single contraction.
+        PAF = 1 - affected(scenario) / affected(baseline), summarised with
+        means and 95% intervals over n_draws odds-ratio draws. Carrier
+        frequencies are drawn from the gnomAD posteriors alongside the odds
+        ratios unless frequency_uncertainty=False.
+        """
+        
+        if scenarios is None:
+            scenarios = self.exposure_intervention_scenarios()
+        
+        rng = np.random.default_rng(seed)
+        tensor = self.stratum_penetrance_tensor(n_draws=n_draws, rng=rng)
+        
+        if frequency_uncertainty and n_draws > 0:
+            carriers = self.frequency_posterior.sample(n_draws, rng, self.strata_levels['mutation'])
+        else:
+            carriers = np.array([[self.carrier_frequencies[m] for m in self.strata_levels['mutation']]])
+        
+        levels, _ = self.exposure_level_table()
+        base_smoking, base_alcohol = levels.sum(axis=1), levels.sum(axis=0)
+        smoking, alcohol = self.exposure_distributions(scenarios, baseline_prevalence={
+            'smoking': 1 - base_smoking[0],
+            'heavy_smoking_fraction': base_smoking[2] / max(1 - base_smoking[0], 1e-300),
+            'alcohol': 1 - base_alcohol[0],
+            'heavy_alcohol_fraction': base_alcohol[2] / max(1 - base_alcohol[0], 1e-300)
+        })
+        counterfactual = np.einsum('sa,nsS,naA->nSA', levels,
+                                   self._level_transitions(base_smoking, smoking),
+                                   self._level_transitions(base_alcohol, alcohol))
+        
+        affected = np.einsum('km,kmsa,nsa->kn', carriers, tensor, counterfactual, optimize=True)
+        baseline = np.einsum('km,kmsa,sa->k', carriers, tensor, levels, optimize=True)[:, None]
+        paf = 1 - affected / baseline
+        
+        return pd.DataFrame({
+            'baseline_affected_per_100k': baseline.mean(),
+            'affected_per_100k': affected.mean(axis=0),
+            'affected_ci_low': np.quantile(affected, 0.025, axis=0),
+            'affected_ci_high': np.quantile(affected, 0.975, axis=0),
+            'cases_prevented_per_100k': (baseline - affected).mean(axis=0),
+            'paf': paf.mean(axis=0),
+            'paf_ci_low': np.quantile(paf, 0.025, axis=0),
+            'paf_ci_high': np.quantile(paf, 0.975, axis=0)
+        }, index=scenarios.index)
     
     def calculate_revised_penetrance_estimates(self):
         """
@@ -374,24 +1471,26 @@ def main():
         print(f"  Literature overestimate: {data['penetrance_ratio_literature_vs_calculated']:.1f}x")
     
     # 3. Bayesian Hierarchical Model
-    print("\n3. BAYESIAN HIERARCHICAL MODEL (1000 simulations)")
+    print("\n3. BAYESIAN HIERARCHICAL MODEL (numerical densities)")
     print("-" * 50)
     
-    bayesian_results = models.bayesian_hierarchical_model(1000)
+    bayesian_results, bayesian_densities = models.bayesian_hierarchical_model(analytic=True)
+    
+    # Per-draw penetrances, as read by lhon_model_validation.py
+    bayesian_draws = models.bayesian_hierarchical_model(1000)
     
     # Summary statistics
-    for col in bayesian_results.columns:
-        mean_val = bayesian_results[col].mean()
-        ci_low = bayesian_results[col].quantile(0.025)
-        ci_high = bayesian_results[col].quantile(0.975)
-        print(f"{col:<40} Mean: {mean_val*100:.1f}% (95% CI: {ci_low*100:.1f}-{ci_high*100:.1f}%)")
+    for scenario, row in bayesian_results.iterrows():
+        print(f"{scenario:<40} Mean: {row['mean']*100:.1f}% "
+              f"(95% CI: {row['q0.025']*100:.1f}-{row['q0.975']*100:.1f}%, "
+              f"P(capped): {row['prob_capped']*100:.1f}%)")
     
     # 4. Monte Carlo Population Model
     print("\n4. MONTE CARLO POPULATION MODEL")
     print("-" * 40)
     
-    mc_results, sample_pop = models.monte_carlo_population_model(
-        population_size=100000, n_simulations=100
+    mc_results, mc_strata, sample_pop = models.monte_carlo_population_model(
+        population_size=100000, n_simulations=100, stratified=True
     )
     
     if mc_results is not None and len(mc_results) > 0:
@@ -399,11 +1498,31 @@ def main():
         print(f"Average population prevalence: {mc_results['population_prevalence'].mean():.2f} per 100,000")
         print(f"Average overall penetrance: {mc_results['overall_penetrance'].mean()*100:.2f}%")
         
+        # Distribution of subgroup penetrance across replicates
+        strata_summary = mc_strata.groupby(['stratum', 'level'], sort=False)['penetrance'].agg(
+            mean='mean',
+            ci_low=lambda x: x.quantile(0.025),
+            ci_high=lambda x: x.quantile(0.975)
+        )
+        for (stratum, level), row in strata_summary.iterrows():
+            print(f"  {stratum}={level:<12} Mean: {row['mean']*100:.1f}% "
+                  f"(95% range: {row['ci_low']*100:.1f}-{row['ci_high']*100:.1f}%)")
+        
+        # 5. Population-attributable fractions
+        print("\n5. POPULATION-ATTRIBUTABLE FRACTIONS")
+        print("-" * 40)
+        
+        paf_results = models.population_attributable_fractions()
+        
+        for scenario, row in paf_results.iterrows():
+            print(f"{scenario:<40} PAF: {row['paf']*100:.1f}% "
+                  f"(95% CI: {row['paf_ci_low']*100:.1f}-{row['paf_ci_high']*100:.1f}%)")
+        
         # Save results
         liability_df = pd.DataFrame(liability_results)
         
         # Create summary tables
-        print("\n5. SAVING RESULTS")
+        print("\n6. SAVING RESULTS")
         print("-" * 20)
         
         # Save liability threshold results
@@ -411,13 +1530,27 @@ def main():
         print("Saved: lhon_liability_model_results.csv")
         
         # Save Bayesian results
-        bayesian_results.to_csv('/home/ubuntu/lhon_bayesian_model_results.csv', index=False)
+        bayesian_draws.to_csv('/home/ubuntu/lhon_bayesian_model_results.csv', index=False)
         print("Saved: lhon_bayesian_model_results.csv")
         
+        bayesian_results.to_csv('/home/ubuntu/lhon_bayesian_model_summary.csv')
+        print("Saved: lhon_bayesian_model_summary.csv")
+        
+        bayesian_densities.to_csv('/home/ubuntu/lhon_bayesian_model_densities.csv', index=False)
+        print("Saved: lhon_bayesian_model_densities.csv")
+        
         # Save Monte Carlo results
         mc_results.to_csv('/home/ubuntu/lhon_monte_carlo_results.csv', index=False)
         print("Saved: lhon_monte_carlo_results.csv")
         
+        # Save per-replicate subgroup counts
+        mc_strata.to_csv('/home/ubuntu/lhon_monte_carlo_strata.csv', index=False)
+        print("Saved: lhon_monte_carlo_strata.csv")
+        
+        # Save population-attributable fractions
+        paf_results.to_csv('/home/ubuntu/lhon_population_attributable_fractions.csv')
+        print("Saved: lhon_population_attributable_fractions.csv")
+        
         # Save revised estimates
         revised_df = pd.DataFrame(revised_estimates).T
         revised_df.to_csv('/home/ubuntu/lhon_revised_penetrance_estimates.csv')
@@ -428,7 +1561,11 @@ def main():
         return {
             'liability_results': liability_df,
             'bayesian_results': bayesian_results,
+            'bayesian_draws': bayesian_draws,
+            'bayesian_densities': bayesian_densities,
             'monte_carlo_results': mc_results,
+            'monte_carlo_strata': mc_strata,
+            'attributable_fractions': paf_results,
             'revised_estimates': revised_df
         }
     
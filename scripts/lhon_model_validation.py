@@ -9,6 +9,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats, optimize
+from lhon_frequency_uncertainty import GnomADFrequencyPosterior
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -76,6 +77,9 @@ class LHONModelValidator:
             }
         }
         
+        # Posterior uncertainty of the carrier frequencies from gnomAD AC/AN
+        self.frequency_posterior = GnomADFrequencyPosterior()
+        
         # Load model results
         self.load_model_results()
     
@@ -162,11 +166,15 @@ class LHONModelValidator:
         # Calculate theoretical prevalence from gnomAD + Watson penetrance
         theoretical_prevalence = self.calculate_theoretical_prevalence()
         
+        theoretical_ci = self.theoretical_prevalence_interval()
+        
         print(f"\nTheoretical prevalence (gnomAD + Watson): {theoretical_prevalence:.2f} per 100,000")
+        print(f"gnomAD sampling 95% CI: {theoretical_ci[0]:.2f}-{theoretical_ci[1]:.2f} per 100,000")
         
         validation_results['theoretical'] = {
             'expected': expected_prevalence,
             'theoretical': theoretical_prevalence,
+            'theoretical_ci': theoretical_ci,
             'ratio': theoretical_prevalence / expected_prevalence
         }
         
@@ -186,6 +194,15 @@ class LHONModelValidator:
         
         return theoretical_prevalence
     
+    def theoretical_prevalence_interval(self, n_draws=10000, ci=0.95):
+        """Interval of the theoretical prevalence from gnomAD sampling uncertainty alone"""
+        
+        total_carriers = self.frequency_posterior.sample(n_draws).sum(axis=1)
+        prevalence = total_carriers * self.empirical_data['watson_penetrance']['overall']
+        
+        tail = (1 - ci) / 2
+        return (float(np.quantile(prevalence, tail)), float(np.quantile(prevalence, 1 - tail)))
+    
     def validate_penetrance_estimates(self):
         """Validate penetrance estimates against literature"""
         
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Polygenic Nuclear Background for the LHON Liability Model
+Samples bit-packed nuclear modifier genotypes and streams weighted liability scores
+"""
+
+import numpy as np
+
+class NuclearPolygenicBackground:
+    """
+    Additive polygenic score over nuclear modifier loci
+
+    Genotypes (0, 1 or 2 alternative alleles) are stored 2 bits each, four
+    per byte, in an (n_carriers, ceil(n_loci / 4)) uint8 array. Scores are
+    computed block by block over carriers and loci, so memory stays bounded
+    by the packed genotypes plus one unpacked block. The score is centred and
+    scaled so that it contributes a liability variance of `heritability`.
+    """
+
+    def __init__(self, allele_frequencies, effect_sizes, heritability=0.1,
+                 block_loci=512, carrier_block=32768):
+        """Initialize from per-locus alternative allele frequencies and effects"""
+
+        if heritability < 0:
+            raise ValueError(f"heritability must be non-negative, got {heritability}")
+
+        self.allele_frequencies = np.asarray(allele_frequencies, dtype=np.float64)
+        self.effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+        self.n_loci = len(self.allele_frequencies)
+        self.heritability = heritability
+
+        # Blocks must cover whole bytes
+        self.block_loci = max(4, block_loci - block_loci % 4)
+        self.carrier_block = carrier_block
+
+        # Standardization of the raw weighted genotype sum
+        p = self.allele_frequencies
+        self.score_mean = np.sum(self.effect_sizes * 2 * p)
+        self.score_sd = np.sqrt(np.sum(self.effect_sizes**2 * 2 * p * (1 - p)))
+
+    @classmethod
+    def simulate(cls, n_loci=5000, heritability=0.1, seed=None, **kwargs):
+        """Random modifier architecture: Beta(1, 3) allele frequencies, Normal effects"""
+
+        rng = np.random.default_rng(seed)
+        allele_frequencies = np.clip(rng.beta(1, 3, n_loci), 0.01, 0.5)
+        effect_sizes = rng.normal(0, 1, n_loci)
+
+        return cls(allele_frequencies, effect_sizes, heritability, **kwargs)
+
+    @staticmethod
+    def pack_genotypes(genotypes):
+        """Pack an (n, m) array of 0/1/2 genotypes into (n, ceil(m / 4)) bytes"""
+
+        genotypes = np.asarray(genotypes, dtype=np.uint8)
+        n, m = genotypes.shape
+        padded = np.zeros((n, -(-m // 4) * 4), dtype=np.uint8)
+        padded[:, :m] = genotypes
+
+        return (padded[:, 0::4] | (padded[:, 1::4] << 2) |
+                (padded[:, 2::4] << 4) | (padded[:, 3::4] << 6))
+
+    @staticmethod
+    def unpack_genotypes(packed, n_loci=None):
+        """Inverse of pack_genotypes"""
+
+        shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+        genotypes = (packed[:, :, None] >> shifts) & 3
+        genotypes = genotypes.reshape(packed.shape[0], -1)
+
+        return genotypes if n_loci is None else genotypes[:, :n_loci]
+
+    def sample_genotypes(self, n_carriers, rng):
+        """Draw packed genotypes under Hardy-Weinberg equilibrium, one locus block at a time"""
+
+        packed = np.empty((n_carriers, -(-self.n_loci // 4)), dtype=np.uint8)
+
+        for start in range(0, self.n_loci, self.block_loci):
+            stop = min(start + self.block_loci, self.n_loci)
+            p = self.allele_frequencies[start:stop].astype(np.float32)
+
+            for row in range(0, n_carriers, self.carrier_block):
+                row_stop = min(row + self.carrier_block, n_carriers)
+                shape = (row_stop - row, stop - start)
+                genotypes = ((rng.random(shape, dtype=np.float32) < p).astype(np.uint8) +
+                             (rng.random(shape, dtype=np.float32) < p))
+                packed[row:row_stop, start // 4:-(-stop // 4)] = self.pack_genotypes(genotypes)
+
+        return packed
+
+    def score_packed(self, packed):
+        """Standardized liability contribution of packed genotypes, streamed over blocks"""
+
+        n_carriers = packed.shape[0]
+        raw = np.zeros(n_carriers)
+
+        for start in range(0, self.n_loci, self.block_loci):
+            stop = min(start + self.block_loci, self.n_loci)
+            weights = self.effect_sizes[start:stop].astype(np.float32)
+
+            for row in range(0, n_carriers, self.carrier_block):
+                row_stop = min(row + self.carrier_block, n_carriers)
+                genotypes = self.unpack_genotypes(packed[row:row_stop, start // 4:-(-stop // 4)], stop - start)
+                raw[row:row_stop] += genotypes.astype(np.float32) @ weights
+
+        return self.standardize(raw)
+
+    def sample_scores(self, n_carriers, rng):
+        """
+        Sample genotypes and return scores without keeping all genotypes
+
+        Carriers are processed in blocks of carrier_block, so only one block
+        of packed genotypes is held in memory at a time.
+        """
+
+        scores = np.empty(n_carriers)
+
+        for row in range(0, n_carriers, self.carrier_block):
+            row_stop = min(row + self.carrier_block, n_carriers)
+            scores[row:row_stop] = self.score_packed(self.sample_genotypes(row_stop - row, rng))
+
+        return scores
+
+    def standardize(self, raw):
+        """Centre and scale raw weighted genotype sums to variance `heritability`"""
+
+        if self.score_sd == 0:
+            return np.zeros_like(raw)
+        return (raw - self.score_mean) / self.score_sd * np.sqrt(self.heritability)
@@ -9,6 +9,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
+from lhon_frequency_uncertainty import GnomADFrequencyPosterior
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -72,6 +73,11 @@ class LHONRealPrevalenceAnalyzer:
             'male_female_ratio': 7.11
         }
         
+        # Posterior uncertainty of the carrier frequencies from gnomAD AC/AN
+        self.frequency_posterior = GnomADFrequencyPosterior()
+        self.n_frequency_draws = 10000
+        self.frequency_draws = None
+        
         # Results storage
         self.prevalence_results = {}
         
@@ -108,6 +114,21 @@ class LHONRealPrevalenceAnalyzer:
         
         return max(0, min(1, penetrance))
     
+    def carrier_frequency_draws(self):
+        """
+        gnomAD posterior draws of the carrier frequencies (per 100,000)
+        
+        One column per mutation in calibrated_parameters order. Drawn once
+        and shared by the carrier and patient prevalence steps so their
+        intervals come from the same draws.
+        """
+        
+        if self.frequency_draws is None:
+            mutations = list(self.calibrated_parameters['carrier_frequencies'].keys())
+            self.frequency_draws = self.frequency_posterior.sample(self.n_frequency_draws, mutations=mutations)
+        
+        return self.frequency_draws
+    
     def calculate_carrier_prevalence(self):
         """Calculate carrier prevalence by mutation and overall"""
         
@@ -117,15 +138,21 @@ class LHONRealPrevalenceAnalyzer:
         carrier_data = []
         total_carriers = 0
         
-        for mutation, frequency in self.calibrated_parameters['carrier_frequencies'].items():
+        # gnomAD sampling uncertainty of the carrier frequencies
+        frequency_draws = self.carrier_frequency_draws()
+        
+        for mutation_index, (mutation, frequency) in enumerate(self.calibrated_parameters['carrier_frequencies'].items()):
             
             # Convert to more interpretable units
             per_100k = frequency
             one_in_x = 100000 / frequency if frequency > 0 else float('inf')
+            ci_low, ci_high = np.quantile(frequency_draws[:, mutation_index], [0.025, 0.975])
             
             carrier_data.append({
                 'mutation': mutation,
                 'frequency_per_100k': per_100k,
+                'frequency_ci_low': ci_low,
+                'frequency_ci_high': ci_high,
                 'one_in_x': one_in_x,
                 'percentage': per_100k / 1000  # Convert to percentage
             })
@@ -133,7 +160,7 @@ class LHONRealPrevalenceAnalyzer:
             total_carriers += per_100k
             
             print(f"{mutation}:")
-            print(f"  Frequency: {per_100k:.2f} per 100,000")
+            print(f"  Frequency: {per_100k:.2f} per 100,000 (gnomAD 95% CI: {ci_low:.2f}-{ci_high:.2f})")
             print(f"  Prevalence: 1 in {one_in_x:.0f}")
             print(f"  Percentage: {per_100k/1000:.3f}%")
             print()
@@ -141,8 +168,11 @@ class LHONRealPrevalenceAnalyzer:
         # Overall carrier prevalence
         overall_one_in_x = 100000 / total_carriers
         
+        total_draws = frequency_draws.sum(axis=1)
+        total_ci = (np.quantile(total_draws, 0.025), np.quantile(total_draws, 0.975))
+        
         print(f"TOTAL CARRIER PREVALENCE:")
-        print(f"  Frequency: {total_carriers:.2f} per 100,000")
+        print(f"  Frequency: {total_carriers:.2f} per 100,000 (gnomAD 95% CI: {total_ci[0]:.2f}-{total_ci[1]:.2f})")
         print(f"  Prevalence: 1 in {overall_one_in_x:.0f}")
         print(f"  Percentage: {total_carriers/1000:.3f}%")
         print()
@@ -152,6 +182,7 @@ class LHONRealPrevalenceAnalyzer:
         self.prevalence_results['carriers'] = {
             'by_mutation': carrier_df,
             'total_per_100k': total_carriers,
+            'total_ci': total_ci,
             'total_one_in_x': overall_one_in_x,
             'total_percentage': total_carriers/1000
         }
@@ -167,8 +198,13 @@ class LHONRealPrevalenceAnalyzer:
         patient_data = []
         total_patients = 0
         
+        # gnomAD sampling uncertainty of the carrier frequencies, one column per mutation
+        mutations = list(self.calibrated_parameters['carrier_frequencies'].keys())
+        frequency_draws = self.carrier_frequency_draws()
+        patient_draws = np.zeros_like(frequency_draws)
+        
         # Calculate for each mutation
-        for mutation in ['11778G>A', '14484T>C', '3460G>A']:
+        for mutation_index, mutation in enumerate(mutations):
             
             carrier_freq = self.calibrated_parameters['carrier_frequencies'][mutation]
             
@@ -209,12 +245,15 @@ class LHONRealPrevalenceAnalyzer:
             
             # Calculate patient prevalence
             patient_prevalence = carrier_freq * avg_penetrance
+            patient_draws[:, mutation_index] = frequency_draws[:, mutation_index] * avg_penetrance
             
             patient_data.append({
                 'mutation': mutation,
                 'carrier_frequency_per_100k': carrier_freq,
                 'average_penetrance': avg_penetrance * 100,  # Convert to percentage
                 'patient_prevalence_per_100k': patient_prevalence,
+                'patient_prevalence_ci_low': np.quantile(patient_draws[:, mutation_index], 0.025),
+                'patient_prevalence_ci_high': np.quantile(patient_draws[:, mutation_index], 0.975),
                 'one_in_x_patients': 100000 / patient_prevalence if patient_prevalence > 0 else float('inf')
             })
             
@@ -223,15 +262,20 @@ class LHONRealPrevalenceAnalyzer:
             print(f"{mutation}:")
             print(f"  Carrier frequency: {carrier_freq:.2f} per 100,000")
             print(f"  Average penetrance: {avg_penetrance*100:.2f}%")
-            print(f"  Patient prevalence: {patient_prevalence:.3f} per 100,000")
+            print(f"  Patient prevalence: {patient_prevalence:.3f} per 100,000 "
+                  f"(gnomAD 95% CI: {patient_data[-1]['patient_prevalence_ci_low']:.3f}-"
+                  f"{patient_data[-1]['patient_prevalence_ci_high']:.3f})")
             print(f"  Patient prevalence: 1 in {100000/patient_prevalence:.0f}" if patient_prevalence > 0 else "  Patient prevalence: <1 in 100,000")
             print()
         
         # Overall patient prevalence
         overall_patient_one_in_x = 100000 / total_patients if total_patients > 0 else float('inf')
         
+        total_draws = patient_draws.sum(axis=1)
+        total_ci = (np.quantile(total_draws, 0.025), np.quantile(total_draws, 0.975))
+        
         print(f"TOTAL PATIENT PREVALENCE:")
-        print(f"  Frequency: {total_patients:.3f} per 100,000")
+        print(f"  Frequency: {total_patients:.3f} per 100,000 (gnomAD 95% CI: {total_ci[0]:.3f}-{total_ci[1]:.3f})")
         print(f"  Prevalence: 1 in {overall_patient_one_in_x:.0f}")
         print()
         
@@ -252,6 +296,7 @@ class LHONRealPrevalenceAnalyzer:
         self.prevalence_results['patients'] = {
             'by_mutation': patient_df,
             'total_per_100k': total_patients,
+            'total_ci': total_ci,
             'total_one_in_x': overall_patient_one_in_x,
             'validation': {
                 'within_range': target_range[0] <= total_patients <= target_range[1],
@@ -537,7 +582,8 @@ class LHONRealPrevalenceAnalyzer:
         sex = self.prevalence_results['sex_specific']
         
         print(f"CARRIER PREVALENCE:")
-        print(f"  Total: {carriers['total_per_100k']:.2f} per 100,000 (1 in {carriers['total_one_in_x']:.0f})")
+        print(f"  Total: {carriers['total_per_100k']:.2f} per 100,000 (1 in {carriers['total_one_in_x']:.0f}; "
+              f"gnomAD 95% CI: {carriers['total_ci'][0]:.2f}-{carriers['total_ci'][1]:.2f})")
         print(f"  Percentage of population: {carriers['total_percentage']:.3f}%")
         print()
         
@@ -10,6 +10,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
 from itertools import product
+from lhon_checkpointing import RunCheckpointer
+from lhon_frequency_uncertainty import GnomADFrequencyPosterior
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -57,6 +59,9 @@ class LHONSensitivityAnalyzer:
             'age_peak_proportion': 0.4
         }
         
+        # Posterior uncertainty of the carrier frequencies from gnomAD AC/AN
+        self.frequency_posterior = GnomADFrequencyPosterior()
+        
         # Define parameter ranges for sensitivity analysis
         self.parameter_ranges = {
             'male_effect': (np.log(3), np.log(15)),  # OR 3-15
@@ -233,16 +238,59 @@ class LHONSensitivityAnalyzer:
         self.sensitivity_results['indices'] = indices
         return indices
     
-    def monte_carlo_sensitivity(self, n_samples=1000):
-        """Perform Monte Carlo sensitivity analysis"""
+    def monte_carlo_sensitivity(self, n_samples=1000, checkpoint_dir=None,
+                                checkpoint_every=100, resume=False,
+                                frequency_uncertainty=False):
+        """
+        Perform Monte Carlo sensitivity analysis
+        
+        With frequency_uncertainty=True the carrier frequencies of every
+        sample are drawn from the gnomAD posteriors, and their total is
+        reported alongside the other parameters as 'carrier_frequency_total'.
+        This shifts the outcome means as well as widening them: the posterior
+        means exceed the AC/AN point values used otherwise (3460G>A, with a
+        single allele, goes from about 1.8 to 2.7 per 100,000).
+        
+        If checkpoint_dir is given, outcomes are checkpointed every
+        checkpoint_every samples; resume=True continues an interrupted sweep
+        with the same parameter samples it started with.
+        """
         
         print("Performing Monte Carlo sensitivity analysis...")
         
-        # Generate random parameter samples
-        parameter_samples = {}
-        
-        for param_name, (min_val, max_val) in self.parameter_ranges.items():
-            parameter_samples[param_name] = np.random.uniform(min_val, max_val, n_samples)
+        checkpointer = None
+        checkpoint = None
+        
+        if checkpoint_dir is not None:
+            checkpointer = RunCheckpointer(
+                checkpoint_dir, 'monte_carlo_sensitivity',
+                config={
+                    'n_samples': n_samples,
+                    'checkpoint_every': checkpoint_every,
+                    'parameter_ranges': dict(self.parameter_ranges),
+                    'frequency_uncertainty': frequency_uncertainty
+                }
+            )
+            checkpoint = checkpointer.load() if resume else None
+            if checkpoint is None:
+                checkpointer.clear()
+        
+        if checkpoint is not None:
+            # Parameter samples were drawn up front and are part of the checkpoint
+            parameter_samples = checkpoint['aggregator']['parameter_samples']
+            start_index = checkpoint['next_index']
+            print(f"Resuming Monte Carlo sensitivity analysis at sample {start_index} of {n_samples}")
+        else:
+            # Generate random parameter samples
+            parameter_samples = {}
+            
+            for param_name, (min_val, max_val) in self.parameter_ranges.items():
+                parameter_samples[param_name] = np.random.uniform(min_val, max_val, n_samples)
+            
+            if frequency_uncertainty:
+                parameter_samples['carrier_frequencies'] = self.frequency_posterior.sample(n_samples, np.random)
+            
+            start_index = 0
         
         # Calculate outcomes for each sample
         prevalences = []
@@ -251,13 +299,29 @@ class LHONSensitivityAnalyzer:
         penetrances_male_14484 = []
         penetrances_male_3460 = []
         
-        for i in range(n_samples):
+        if checkpoint is not None:
+            for record in checkpoint['records']:
+                prevalences.append(record['prevalence'])
+                penetrances_male_11778.append(record['penetrance_male_11778'])
+                penetrances_female_11778.append(record['penetrance_female_11778'])
+                penetrances_male_14484.append(record['penetrance_male_14484'])
+                penetrances_male_3460.append(record['penetrance_male_3460'])
+        
+        block_records = []
+        
+        for i in range(start_index, n_samples):
             
             # Create parameter set for this sample
             sample_params = self.base_parameters.copy()
             for param_name in self.parameter_ranges.keys():
                 sample_params[param_name] = parameter_samples[param_name][i]
             
+            if frequency_uncertainty:
+                sample_params['carrier_frequencies'] = dict(zip(
+                    self.frequency_posterior.mutations,
+                    parameter_samples['carrier_frequencies'][i] / 100000
+                ))
+            
             # Calculate outcomes
             prevalence = self.calculate_population_prevalence(sample_params)
             pen_male_11778 = self.calculate_penetrance('11778G>A', 'Male', parameters=sample_params)
@@ -270,6 +334,20 @@ class LHONSensitivityAnalyzer:
             penetrances_female_11778.append(pen_female_11778 * 100)
             penetrances_male_14484.append(pen_male_14484 * 100)
             penetrances_male_3460.append(pen_male_3460 * 100)
+            
+            # Checkpoint each completed block of samples
+            if checkpointer is not None:
+                block_records.append({
+                    'prevalence': prevalence,
+                    'penetrance_male_11778': pen_male_11778 * 100,
+                    'penetrance_female_11778': pen_female_11778 * 100,
+                    'penetrance_male_14484': pen_male_14484 * 100,
+                    'penetrance_male_3460': pen_male_3460 * 100
+                })
+                if (i + 1) % checkpoint_every == 0 or i + 1 == n_samples:
+                    checkpointer.save(i + 1, block_records,
+                                      aggregator={'parameter_samples': parameter_samples})
+                    block_records = []
         
         # Calculate correlations
         correlations = {}
@@ -287,6 +365,13 @@ class LHONSensitivityAnalyzer:
                 corr = np.corrcoef(parameter_samples[param_name], outcome_values)[0, 1]
                 correlations[param_name][outcome_name] = corr
         
+        if frequency_uncertainty:
+            total_frequency = parameter_samples['carrier_frequencies'].sum(axis=1)
+            correlations['carrier_frequency_total'] = {
+                outcome_name: np.corrcoef(total_frequency, outcome_values)[0, 1]
+                for outcome_name, outcome_values in outcomes.items()
+            }
+        
         self.sensitivity_results['monte_carlo'] = {
             'parameter_samples': parameter_samples,
             'outcomes': outcomes,
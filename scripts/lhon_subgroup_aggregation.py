@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Subgroup Aggregation for LHON Simulations
+Single-pass subgroup counts and rate intervals over integer-coded samples
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+def wilson_interval(successes, n, ci=0.95):
+    """Wilson score interval for binomial proportions (n may be an effective size)"""
+
+    successes = np.asarray(successes, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    z = stats.norm.ppf(1 - (1 - ci) / 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = successes / n
+        denominator = 1 + z**2 / n
+        centre = (p + z**2 / (2 * n)) / denominator
+        half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+
+    return np.clip(centre - half_width, 0, 1), np.clip(centre + half_width, 0, 1)
+
+def jeffreys_interval(successes, n, ci=0.95):
+    """Jeffreys (Beta(0.5, 0.5) posterior) interval for binomial proportions"""
+
+    successes = np.asarray(successes, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    tail = (1 - ci) / 2
+
+    with np.errstate(invalid='ignore'):
+        low = np.where(successes > 0, stats.beta.ppf(tail, successes + 0.5, n - successes + 0.5), 0.0)
+        high = np.where(successes < n, stats.beta.ppf(1 - tail, successes + 0.5, n - successes + 0.5), 1.0)
+
+    empty = n <= 0
+    return np.where(empty, np.nan, low), np.where(empty, np.nan, high)
+
+class SubgroupAggregator:
+    """
+    Declarative subgroup rate tables over integer-coded columns
+
+    Each grouping names the columns to break down by, an optional filter
+    ({column: allowed levels}), an outcome column and its success levels.
+    The breakdown columns are combined into one mixed-radix key, filtered
+    rows are sent to an overflow bin, and all cells of a grouping are
+    counted with a single np.bincount over key * 2 + success (plus weight
+    sums for weighted samples). Adding cells to a grouping is essentially
+    free; each extra grouping costs one pass over the samples.
+    """
+
+    def __init__(self, levels):
+        """Initialize with {column: ordered list of level names}"""
+
+        self.levels = {column: list(values) for column, values in levels.items()}
+        self.codes = {column: {level: code for code, level in enumerate(values)}
+                      for column, values in self.levels.items()}
+        self.groupings = []
+
+    def add_grouping(self, name, by=(), outcome=None, success=(), where=None, label=None):
+        """
+        Register a grouping
+
+        label is a format string over the `by` columns (e.g.
+        '{mtDNA_Mutation}_Any_Recovery'); by default cell labels are the
+        levels joined by '_', or `name` for a grouping without `by` columns.
+        Returns self so calls can be chained.
+        """
+
+        for column in list(by) + [outcome] + list(where or {}):
+            if column not in self.levels:
+                raise ValueError(f"Unknown column {column}")
+
+        self.groupings.append({
+            'name': name,
+            'by': list(by),
+            'outcome': outcome,
+            'success': [self.codes[outcome][level] for level in success],
+            'where': {column: [self.codes[column][level] for level in allowed]
+                      for column, allowed in (where or {}).items()},
+            'label': label
+        })
+        return self
+
+    def _column_codes(self, samples, column):
+        """Integer codes of one column of a dict of arrays or a DataFrame"""
+
+        values = samples[column]
+        if isinstance(values, pd.Series):
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                if list(values.cat.categories) == self.levels[column]:
+                    return values.cat.codes.to_numpy()
+                # Remap category codes to this aggregator's level order (-1 if unknown)
+                remap = np.array([self.codes[column].get(category, -1)
+                                  for category in values.cat.categories] + [-1], dtype=np.int64)
+                return remap[values.cat.codes.to_numpy()]
+            if not pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                return values.map(self.codes[column]).fillna(-1).to_numpy(dtype=np.int64)
+            values = values.to_numpy()
+        return np.asarray(values).astype(np.int64, copy=False)
+
+    def count(self, samples, weights=None):
+        """
+        Raw per-cell totals for every grouping
+
+        Returns a list of (grouping, n, successes, sum of squared weights)
+        with arrays over the grouping's mixed-radix cells. Rows with an
+        unknown level (code -1) in a `by` or outcome column are left out,
+        and never match a `where` filter.
+        """
+
+        cache = {}
+
+        def codes(column):
+            if column not in cache:
+                cache[column] = self._column_codes(samples, column)
+            return cache[column]
+
+        def lookup(column, selected):
+            # Boolean/0-1 per row for membership of a level set, shared across
+            # groupings; unknown levels (code -1) are never selected
+            key = (column, tuple(selected))
+            if key not in cache:
+                n_levels = len(self.levels[column])
+                table = np.zeros(n_levels + 1, dtype=np.int8)
+                table[list(selected)] = 1
+                cache[key] = table[np.where(codes(column) >= 0, codes(column), n_levels)]
+            return cache[key]
+
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+
+        results = []
+        for grouping in self.groupings:
+            radices = [len(self.levels[column]) for column in grouping['by']]
+            n_cells = int(np.prod(radices)) if radices else 1
+
+            n_rows = len(codes(grouping['outcome']))
+            key = np.zeros(n_rows, dtype=np.intp)
+            for column, radix in zip(grouping['by'], radices):
+                key *= radix
+                key += codes(column)
+
+            keep = np.ones(n_rows, dtype=bool)
+            for column, allowed in grouping['where'].items():
+                keep &= lookup(column, allowed).view(bool)
+            for column in grouping['by'] + [grouping['outcome']]:
+                keep &= codes(column) >= 0
+            key[~keep] = n_cells
+
+            success = lookup(grouping['outcome'], grouping['success'])
+
+            if weights is None:
+                key *= 2
+                key += success
+                table = np.bincount(key, minlength=2 * (n_cells + 1)).reshape(-1, 2)[:n_cells]
+                n = table.sum(axis=1).astype(np.float64)
+                successes = table[:, 1].astype(np.float64)
+                squared = n
+            else:
+                n = np.bincount(key, weights=weights, minlength=n_cells + 1)[:n_cells]
+                successes = np.bincount(key, weights=weights * success, minlength=n_cells + 1)[:n_cells]
+                squared = np.bincount(key, weights=weights**2, minlength=n_cells + 1)[:n_cells]
+
+            results.append((grouping, n, successes, squared))
+
+        return results
+
+    def cells(self, grouping):
+        """
+        One row per cell of a grouping, in mixed-radix order
+
+        Columns are grouping, subgroup label and the level of each `by`
+        column.
+        """
+
+        cells = (pd.MultiIndex.from_product([self.levels[c] for c in grouping['by']],
+                                            names=grouping['by']).to_frame(index=False)
+                 if grouping['by'] else pd.DataFrame(index=[0]))
+
+        if not grouping['by']:
+            labels = [grouping['label'] or grouping['name']]
+        elif grouping['label'] is not None:
+            labels = [grouping['label'].format(**row) for row in cells.to_dict('records')]
+        else:
+            labels = ['_'.join(str(v) for v in row) for row in cells.itertuples(index=False)]
+
+        cells.insert(0, 'subgroup', labels)
+        cells.insert(0, 'grouping', grouping['name'])
+        return cells
+
+    def aggregate(self, samples, weights=None, method='wilson', ci=0.95):
+        """
+        Tidy table of subgroup rates with confidence intervals
+
+        samples is a DataFrame or dict of equal-length arrays of integer
+        codes (categorical or label columns are encoded). With weights, the
+        intervals use each cell's Kish effective sample size. Returns one row
+        per cell: grouping, subgroup label, the level of each `by` column,
+        n, successes, effective_n, rate, ci_low and ci_high.
+        """
+
+        interval = {'wilson': wilson_interval, 'jeffreys': jeffreys_interval}[method]
+        frames = []
+
+        for grouping, n, successes, squared in self.count(samples, weights):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rate = np.where(n > 0, successes / n, np.nan)
+                effective_n = np.where(squared > 0, n**2 / squared, 0.0)
+            ci_low, ci_high = interval(rate * effective_n, effective_n, ci)
+
+            frame = self.cells(grouping)
+            frame['n'] = n
+            frame['successes'] = successes
+            frame['effective_n'] = effective_n
+            frame['rate'] = rate
+            frame['ci_low'] = ci_low
+            frame['ci_high'] = ci_high
+            frames.append(frame)
+
+        return pd.concat(frames, ignore_index=True)